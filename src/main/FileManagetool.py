@@ -2,26 +2,204 @@ import os
 import shutil
 import re
 import logging
-import csv
-from docx import Document
-from PyPDF2 import PdfReader
-import openpyxl
+import hashlib
+import json
+import time
+import html
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
     QFileDialog, QLineEdit, QProgressBar, QTableWidget, QTableWidgetItem,
     QHeaderView, QMessageBox, QCheckBox, QFrame, QComboBox, QSpinBox,
-    QScrollArea, QSizePolicy, QTabWidget
+    QScrollArea, QSizePolicy, QTabWidget, QTextBrowser
 )
 from PyQt6.QtGui import QIcon
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+from search_engine import (
+    build_regex, search_file_steps, summarize_locations, match_context, file_signature, discover_files, FileBudget,
+    ExtractionAborted
+)
+from output_modes import OUTPUT_MODES, materialize_file
+from trigram_index import TrigramIndex, regex_query
+from regex_backend import engine_name
+from search_daemon import daemon_available, daemon_search
+from search_cluster import parse_workers, cluster_search
+from prefetch import Prefetcher, DEFAULT_DEPTH
+from parse_pool import ParsePool, PARSE_POOL_TYPES, MAX_PROCESSES
+from autotune import Autotuner, load_settings
+from bloom_filter import SummaryBuilder, SummaryStore, required_words, may_match
+from query_language import QuerySyntaxError, BooleanQuery
+from ranking import BM25Ranker, DocumentStats, DEFAULT_TOP_K
+from csv_merge import (
+    merge_csv, detect_dialects, dialect_notes, MergeError, SCHEMA_MODES, SORT_TYPES, OUTPUT_FORMATS
+)
 
 logging.basicConfig(
     filename='file_search_errors.log',
-    level=logging.ERROR,
+    level=logging.WARNING,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# -------------------- Duplicate Detection --------------------
+PARTIAL_HASH_SIZE = 64 * 1024
+
 
+def hash_file(file_path, limit=None, chunk_size=1024 * 1024, check=None):
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = limit
+    with open(file_path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            if check:
+                check()
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def group_duplicates(file_list, check=None):
+    """Group byte-identical files, keeping the first path of each group.
+
+    Candidates are narrowed by extension and size, then by a hash of the
+    first 64 KB and only then by a full hash, so unique files are rarely
+    read at all. Returns (unique_files, duplicates) where duplicates maps a
+    kept path to the list of identical paths it stands in for. check, if
+    given, is called before every chunk read and may raise
+    ExtractionAborted to stop.
+    """
+    def refine(groups, key_func):
+        refined = []
+        for group in groups:
+            if len(group) < 2:
+                refined.append(group)
+                continue
+            buckets = {}
+            for path in group:
+                try:
+                    key = key_func(path)
+                except OSError as e:
+                    logging.error(f"Error hashing {path}: {e}")
+                    key = ('unreadable', path)
+                buckets.setdefault(key, []).append(path)
+            refined.extend(buckets.values())
+        return refined
+
+    groups = refine([file_list], lambda p: (os.path.splitext(p)[1].lower(), os.path.getsize(p)))
+    groups = refine(groups, lambda p: hash_file(p, PARTIAL_HASH_SIZE, check=check))
+    groups = refine(groups, lambda p: hash_file(p, check=check))
+
+    duplicates = {group[0]: group[1:] for group in groups}
+    unique_files = [path for path in file_list if path in duplicates]
+    return unique_files, duplicates
+
+# -------------------- Search Checkpoints --------------------
+CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.file_search', 'checkpoints')
+CHECKPOINT_KEYS = ('source_loc', 'out_loc', 'search_string', 'case_sensitive',
+                   'whole_word', 'use_regex', 'boolean_query', 'file_types', 'output_mode', 'dedup',
+                   'rank_results')
+
+
+class SearchCheckpoint:
+    """Append-only journal of finished files, so a stopped search can resume.
+
+    Each search (identified by its parameters) gets one JSON-lines file with
+    one compact record per searched file: path, size, mtime and the result
+    row, if any. Records are buffered and flushed every few seconds and
+    when the search ends for any reason; a half-written last line from a
+    crash is ignored on load.
+    """
+
+    def __init__(self, search_params, directory=CHECKPOINT_DIR, flush_interval=5.0):
+        key = json.dumps({k: search_params.get(k) for k in CHECKPOINT_KEYS}, sort_keys=True)
+        self.path = os.path.join(directory, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.jsonl')
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        completed = {}
+        if not self.exists():
+            return completed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('t') == 'f':
+                    completed[record['p']] = (record['s'], record['m'], record['r'])
+        return completed
+
+    def start(self, resume=False):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not resume:
+            open(self.path, 'w', encoding='utf-8').close()
+
+    def record(self, file_path, signature, row):
+        size, mtime = signature if signature else (None, None)
+        self.pending.append({'t': 'f', 'p': file_path, 's': size, 'm': mtime, 'r': row})
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in self.pending))
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def finish(self):
+        self.pending = []
+        if self.exists():
+            os.remove(self.path)
+
+# -------------------- Search Scheduling --------------------
+SCHEDULE_POLICIES = ('walk', 'smallest', 'newest', 'priority')
+INTERLEAVE_SLOTS = 4
+SCHEDULE_LOOKAHEAD = 256
+SLICE_SECONDS = 0.05
+ABANDONED_LABELS = {
+    'timed out': "Timed out (file time limit reached)",
+    'too large': "Skipped (file size limit exceeded)",
+    'regex timed out': "Timed out (regex match limit reached)",
+}
+
+
+def schedule_files(file_list, policy, priority_dirs=()):
+    """Order the search queue: walk order, smallest first, newest first or by folder priority"""
+    if policy in ('smallest', 'newest'):
+        stats = {}
+        for path in file_list:
+            try:
+                stats[path] = os.stat(path)
+            except OSError:
+                stats[path] = None
+        if policy == 'smallest':
+            return sorted(file_list, key=lambda p: stats[p].st_size if stats[p] else float('inf'))
+        return sorted(file_list, key=lambda p: -stats[p].st_mtime if stats[p] else float('inf'))
+
+    if policy == 'priority' and priority_dirs:
+        roots = [os.path.abspath(d).rstrip(os.sep) + os.sep for d in priority_dirs]
+
+        def rank(path):
+            path = os.path.abspath(path)
+            for i, root in enumerate(roots):
+                if path.startswith(root):
+                    return i
+            return len(roots)
+        return sorted(file_list, key=rank)
+
+    return file_list
+
+# -------------------- Search Thread --------------------
 class SearchThread(QThread):
     update_progress = pyqtSignal(int, str)
     search_complete = pyqtSignal(list)
@@ -31,125 +209,390 @@ class SearchThread(QThread):
         super().__init__()
         self.search_params = search_params
         self.stop_search = False
+        self.time_to_first_result = None
 
     def run(self):
+        checkpoint = None
         try:
+            started = time.monotonic()
             source_loc = self.search_params['source_loc']
             out_loc = self.search_params['out_loc']
             search_string = self.search_params['search_string']
             case_sensitive = self.search_params['case_sensitive']
             whole_word = self.search_params['whole_word']
             use_regex = self.search_params['use_regex']
+            boolean_query = self.search_params.get('boolean_query', False)
             file_types = self.search_params['file_types']
+            output_mode = self.search_params.get('output_mode', 'copy')
+            dedup = self.search_params.get('dedup', False)
+            resume = self.search_params.get('resume', False)
+            use_index = self.search_params.get('use_index', False)
+            use_summaries = self.search_params.get('use_summaries', False)
+            schedule = self.search_params.get('schedule', 'walk')
+            time_budget = self.search_params.get('file_time_budget', 0)
+            size_budget = self.search_params.get('file_size_budget', 0)
+            prefetch_depth = self.search_params.get('prefetch_depth', 0)
+            parse_processes = self.search_params.get('parse_processes', 0)
+            autotune = self.search_params.get('autotune', False)
+            priority_dirs = self.search_params.get('priority_dirs', ())
+            rank_results = self.search_params.get('rank_results', False)
+            top_k = self.search_params.get('top_k', DEFAULT_TOP_K)
 
             will_save = bool(out_loc)
             if will_save:
                 os.makedirs(out_loc, exist_ok=True)
+
+            if self.search_params.get('workers'):
+                self.run_with_workers()
+                return
+
+            if self.search_params.get('use_daemon') and daemon_available():
+                self.run_with_daemon()
+                return
             
             matching_files = []
-            if os.path.isfile(source_loc):
-                file_list = [source_loc] if source_loc.lower().endswith(tuple(file_types)) else []
-            else:
-                file_list = [
-                    os.path.join(root, file) 
-                    for root, _, files in os.walk(source_loc) 
-                    for file in files 
-                    if file.lower().endswith(tuple(file_types))
-                ]
+            file_list = discover_files(source_loc, file_types, lambda: self.stop_search)
+
+            duplicates = {}
+            if dedup and len(file_list) > 1:
+                self.update_progress.emit(0, f"Checking {len(file_list)} files for duplicates...")
+                found_files = len(file_list)
+                try:
+                    file_list, duplicates = group_duplicates(
+                        file_list, FileBudget(cancelled=lambda: self.stop_search).check)
+                    self.update_progress.emit(0, f"Skipping {found_files - len(file_list)} duplicate files")
+                except ExtractionAborted:
+                    pass  # stopped; the search loop below ends straight away
+
+            if use_index and file_list:
+                file_list = self.narrow_with_index(
+                    source_loc, file_list, search_string,
+                    case_sensitive, whole_word, use_regex, boolean_query
+                )
 
+            file_list = schedule_files(file_list, schedule, priority_dirs)
             total_files = len(file_list)
             self.update_progress.emit(0, f"Found {total_files} files to search")
 
-            for i, file_path in enumerate(file_list):
-                if self.stop_search:
-                    break
+            checkpoint = SearchCheckpoint(self.search_params)
+            if resume and rank_results:
+                # Ranked rows are only made at the end, so there is nothing to resume from.
+                self.update_progress.emit(0, "Ranked searches start afresh")
+                resume = False
+            completed = checkpoint.load() if resume else {}
+            if resume:
+                if completed:
+                    self.update_progress.emit(0, f"Resuming: {len(completed)} files already searched")
+                else:
+                    self.update_progress.emit(0, "No checkpoint found, starting a fresh search")
+            checkpoint.start(resume and bool(completed))
 
-                filename = os.path.basename(file_path)
-                ext = os.path.splitext(filename)[1].lower()
-                
-                occurrences, locations = self.search_in_file(
-                    file_path, ext, search_string, 
-                    case_sensitive, whole_word, use_regex
+            try:
+                regex = build_regex(search_string, case_sensitive, whole_word, use_regex, boolean_query)
+            except re.error as e:
+                self.error_occurred.emit(f"Invalid regex: {str(e)}")
+                return
+            except QuerySyntaxError as e:
+                self.error_occurred.emit(f"Invalid query: {str(e)}")
+                return
+            if use_regex and not boolean_query:
+                self.update_progress.emit(0, f"Regex engine: {engine_name(regex)}")
+
+            summaries = SummaryStore() if use_summaries else None
+            if summaries:
+                query = regex_query(regex)
+                words = required_words(search_string, whole_word, use_regex or boolean_query)
+            ranker = None
+            if rank_results:
+                terms = [term for _, term in regex.terms] if isinstance(regex, BooleanQuery) else [regex]
+                corpus = self.index_corpus(source_loc, terms) if use_index else None
+                ranker = BM25Ranker(len(terms), top_k, corpus)
+
+            queue = deque()
+            ruled_out = 0
+            for file_path in file_list:
+                signature = file_signature(file_path)
+                previous = completed.get(file_path)
+                if previous and signature and tuple(previous[:2]) == signature:
+                    if previous[2]:
+                        matching_files.append(previous[2])
+                    continue
+                bloom = summaries.get(file_path, signature) if summaries else None
+                if bloom is not None and not may_match(bloom, query, words):
+                    ruled_out += 1
+                    continue
+                queue.append((file_path, signature))
+            done_files = total_files - len(queue)
+            if summaries:
+                self.update_progress.emit(
+                    int(done_files / total_files * 100) if total_files else 0,
+                    f"Summaries ruled out {ruled_out} of {total_files} files without opening them"
                 )
 
-                if occurrences > 0:
-                    if will_save:
-                        try:
-                            dest_path = os.path.join(out_loc, filename)
-                            shutil.copy2(file_path, dest_path)
-                            matching_files.append([filename, occurrences, locations, dest_path])
-                        except Exception as e:
-                            self.error_occurred.emit(f"Failed to copy {filename}: {str(e)}")
+            if autotune:
+                tuned = load_settings(source_loc)
+                prefetch_depth = tuned.get('io_depth', prefetch_depth or DEFAULT_DEPTH)
+                parse_processes = tuned.get('cpu_slots', max(parse_processes, 1))
+            prefetcher = Prefetcher([path for path, _ in queue], prefetch_depth) if prefetch_depth else None
+            parse_pool = ParsePool(parse_processes)
+            tuner = None
+            if autotune and prefetcher:
+                tuner = Autotuner(source_loc, prefetcher, parse_pool,
+                                  report=lambda message: self.update_progress.emit(
+                                      int(done_files / total_files * 100), message))
+
+            # Round-robin over a few files at a time, each getting a short time
+            # slice per turn, so one huge file cannot hold back the others.
+            # Documents go to the parser processes instead when there are any.
+            active = deque()
+            parsing = {}
+            while (queue or active or parsing) and not self.stop_search:
+                # Files whose kind of slot is full wait in order while later
+                # files that fit a free slot go ahead of them.
+                waiting = []
+                while queue and len(waiting) < SCHEDULE_LOOKAHEAD:
+                    pool_full = len(parsing) >= parse_pool.slots
+                    thread_full = len(active) >= INTERLEAVE_SLOTS
+                    if thread_full and pool_full:
+                        break
+                    file_path, signature = queue.popleft()
+                    ext = os.path.splitext(file_path)[1].lower()
+                    to_pool = parse_pool.slots > 0 and ext in PARSE_POOL_TYPES
+                    if pool_full if to_pool else thread_full:
+                        waiting.append((file_path, signature))
+                        continue
+                    data = prefetcher.take(file_path) if prefetcher else None
+                    if to_pool:
+                        future = parse_pool.submit(file_path, ext, regex, data, time_budget, size_budget,
+                                                   summarize=bool(summaries), rank=bool(ranker))
+                        parsing[future] = (file_path, signature)
                     else:
-                        matching_files.append([filename, occurrences, locations, "Not saved"])
-
-                progress = int((i + 1) / total_files * 100)
-                self.update_progress.emit(progress, f"Processing {filename}...")
-
+                        budget = FileBudget(time_budget, size_budget, lambda: self.stop_search)
+                        summary = SummaryBuilder() if summaries else None
+                        stats = DocumentStats() if ranker else None
+                        active.append((file_path, signature, summary, stats,
+                                       search_file_steps(file_path, ext, regex, budget, data, summary, stats,
+                                                         SLICE_SECONDS)))
+                queue.extendleft(reversed(waiting))
+
+                finished = []
+                for future in [f for f in parsing if f.done()]:
+                    *result, summary, stats = parse_pool.finished(future)
+                    finished.append((*parsing.pop(future), result, summary, stats))
+                if active:
+                    file_path, signature, summary, stats, steps = active.popleft()
+                    try:
+                        next(steps)
+                        active.append((file_path, signature, summary, stats, steps))
+                    except StopIteration as done:
+                        finished.append((file_path, signature, done.value,
+                                         summary.build() if summary and summary.complete else None, stats))
+                elif parsing and not finished:
+                    wait(parsing, timeout=SLICE_SECONDS, return_when=FIRST_COMPLETED)
+
+                for file_path, signature, (occurrences, offsets, status), summary, stats in finished:
+                    if status == 'cancelled':
+                        continue
+                    if summary:
+                        summaries.put(file_path, signature, summary)
+                    if ranker and not status:
+                        ranker.observe(stats)
+
+                    filename = os.path.basename(file_path)
+                    row = None
+                    if status:
+                        row = [filename, occurrences, ABANDONED_LABELS[status], "Not saved",
+                               ', '.join(duplicates.get(file_path, [])),
+                               {'path': os.path.abspath(file_path), 'offsets': offsets}]
+                        matching_files.append(row)
+                    elif occurrences > 0 and ranker:
+                        # Saved at the end, once it is known whether the file made the top k.
+                        ranker.add((file_path, occurrences, offsets), stats)
+                    elif occurrences > 0:
+                        row = self.make_result_row(file_path, occurrences, offsets, out_loc,
+                                                   output_mode, duplicates.get(file_path, []))
+                        if row:
+                            matching_files.append(row)
+                            if self.time_to_first_result is None:
+                                self.time_to_first_result = time.monotonic() - started
+                                self.update_progress.emit(
+                                    int(done_files / total_files * 100),
+                                    f"First result after {self.time_to_first_result:.2f}s: {filename}"
+                                )
+
+                    done_files += 1
+                    checkpoint.record(file_path, signature, row)
+                    progress = int(done_files / total_files * 100)
+                    self.update_progress.emit(progress, f"Processing {filename}...")
+                    if tuner:
+                        tuner.file_done()
+
+                if tuner:
+                    tuner.tick(any(os.path.splitext(path)[1].lower() in PARSE_POOL_TYPES
+                                   for path, _ in list(queue)[:64]))
+
+            for *_, steps in active:
+                steps.close()
+            parse_pool.close()
+            if summaries:
+                summaries.close()
+            if prefetcher:
+                prefetcher.close()
+            if tuner:
+                tuner.save()
+            if hasattr(regex, 'close'):
+                regex.close()
+
+            if ranker:
+                ranked = []
+                for score, (file_path, occurrences, offsets) in ranker.results():
+                    row = self.make_result_row(file_path, occurrences, offsets, out_loc,
+                                               output_mode, duplicates.get(file_path, []), f"{score:.3f}")
+                    if row:
+                        ranked.append(row)
+                matching_files = ranked + matching_files
+
+            if not self.stop_search:
+                checkpoint.finish()
             self.search_complete.emit(matching_files)
 
         except Exception as e:
             self.error_occurred.emit(f"Search error: {str(e)}")
+        finally:
+            if checkpoint:
+                checkpoint.flush()
+
+    def run_with_daemon(self):
+        """Let the background search daemon do the search and stream its results"""
+        out_loc = self.search_params['out_loc']
+        output_mode = self.search_params.get('output_mode', 'copy')
+        params = {key: value for key, value in self.search_params.items() if key != 'resume'}
+        params['source_loc'] = os.path.abspath(params['source_loc'])
+        matching_files = []
+        started = time.monotonic()
+
+        records = daemon_search(params)
+        try:
+            for record in records:
+                if self.stop_search:
+                    break
+                if record['t'] == 'progress':
+                    self.update_progress.emit(record['value'], record['message'])
+                elif record['t'] == 'match':
+                    if record['status']:
+                        row = [os.path.basename(record['path']), record['occurrences'],
+                               ABANDONED_LABELS[record['status']], "Not saved", '',
+                               {'path': record['path'], 'offsets': record.get('offsets', [])}]
+                    else:
+                        row = self.make_result_row(record['path'], record['occurrences'],
+                                                   record.get('offsets', []), out_loc, output_mode, [])
+                    if row:
+                        matching_files.append(row)
+                        if self.time_to_first_result is None:
+                            self.time_to_first_result = time.monotonic() - started
+                elif record['t'] == 'error':
+                    self.error_occurred.emit(f"Search error: {record['message']}")
+                    return
+        finally:
+            records.close()
+
+        self.search_complete.emit(matching_files)
+
+    def run_with_workers(self):
+        """Fan the search out to remote worker daemons and merge their results"""
+        try:
+            workers = parse_workers(self.search_params['workers'])
+        except ValueError as e:
+            self.error_occurred.emit(str(e))
+            return
+        params = {key: value for key, value in self.search_params.items()
+                  if key not in ('resume', 'workers', 'source_loc', 'out_loc')}
+        matching_files, errors = [], []
+        started = time.monotonic()
+
+        for record in cluster_search(params, workers, lambda: self.stop_search):
+            if record['t'] == 'progress':
+                self.update_progress.emit(record['value'], record['message'])
+            elif record['t'] == 'match':
+                locations = ABANDONED_LABELS[record['status']] if record['status'] else record['locations']
+                matching_files.append([os.path.basename(record['path']), record['occurrences'], locations,
+                                       f"On {record['worker']}: {record['path']}", ''])
+                if self.time_to_first_result is None:
+                    self.time_to_first_result = time.monotonic() - started
+            elif record['t'] == 'error':
+                errors.append(record['message'])
+                self.update_progress.emit(0, record['message'])
+
+        if errors:
+            logging.error("Worker errors: " + '; '.join(errors))
+        self.search_complete.emit(matching_files)
+
+    def narrow_with_index(self, source_loc, file_list, search_string, case_sensitive, whole_word, use_regex,
+                          boolean_query=False):
+        """Drop files the trigram index proves cannot match, indexing changed files first"""
+        try:
+            regex = build_regex(search_string, case_sensitive, whole_word, use_regex, boolean_query)
+        except (re.error, QuerySyntaxError):
+            return file_list
 
-    def search_in_file(self, file_path, extension, search_string, case_sensitive, whole_word, use_regex):
+        index = TrigramIndex.for_root(source_loc)
         try:
-            occurrences, locations = 0, []
-            flags = 0 if case_sensitive else re.IGNORECASE
-            
-            if use_regex:
-                pattern = search_string
-            else:
-                pattern = re.escape(search_string)
-                if whole_word:
-                    pattern = r'\b' + pattern + r'\b'
+            stale = index.stale_files(file_list)
+            if stale:
+                self.update_progress.emit(0, f"Indexing {len(stale)} new or changed files...")
+                index.update(stale, should_stop=lambda: self.stop_search)
+
+            candidates = index.candidates(regex)
+            if candidates is None:
+                return file_list
+            narrowed = [
+                path for path in file_list
+                if os.path.abspath(path) in candidates or not index.is_current(path)
+            ]
+            self.update_progress.emit(0, f"Index narrowed {len(file_list)} files to {len(narrowed)} candidates")
+            return narrowed
+        except Exception as e:
+            logging.error(f"Trigram index error for {source_loc}: {e}")
+            return file_list
+        finally:
+            index.close()
+
+    def index_corpus(self, source_loc, terms):
+        """BM25 corpus statistics from the trigram index, or None without one"""
+        index = TrigramIndex.for_root(source_loc)
+        try:
+            stats = index.corpus_stats()
+            if stats is None:
+                return None
+            doc_freqs = {}
+            for i, term in enumerate(terms):
+                freq = index.document_frequency(term)
+                if freq is not None:
+                    doc_freqs[i] = freq
+            return stats[0], stats[1], doc_freqs
+        except Exception as e:
+            logging.error(f"Trigram index error for {source_loc}: {e}")
+            return None
+        finally:
+            index.close()
 
-            try:
-                regex = re.compile(pattern, flags)
-            except re.error as e:
-                return 0, f"Invalid regex: {str(e)}"
-
-            if extension == '.txt':
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    for i, line in enumerate(f, start=1):
-                        matches = regex.finditer(line)
-                        for match in matches:
-                            occurrences += 1
-                            locations.append(f"Line {i} (Pos {match.start()+1})")
-
-            elif extension == '.docx':
-                doc = Document(file_path)
-                for i, para in enumerate(doc.paragraphs, start=1):
-                    matches = regex.finditer(para.text)
-                    for match in matches:
-                        occurrences += 1
-                        locations.append(f"Paragraph {i} (Pos {match.start()+1})")
-
-            elif extension == '.xlsx':
-                workbook = openpyxl.load_workbook(file_path)
-                for sheet_name in workbook.sheetnames:
-                    sheet = workbook[sheet_name]
-                    for row in sheet.iter_rows():
-                        for cell in row:
-                            if cell.value:
-                                matches = regex.finditer(str(cell.value))
-                                for match in matches:
-                                    occurrences += 1
-                                    locations.append(f"Sheet '{sheet_name}' Cell {cell.coordinate}")
-
-            elif extension == '.pdf':
-                reader = PdfReader(file_path)
-                for i, page in enumerate(reader.pages, start=1):
-                    text = page.extract_text() or ""
-                    matches = regex.finditer(text)
-                    for match in matches:
-                        occurrences += 1
-                        locations.append(f"Page {i} (Pos {match.start()+1})")
-
-            return occurrences, ', '.join(locations[:3]) + ('...' if len(locations) > 3 else '')
-        
+    def make_result_row(self, file_path, occurrences, offsets, out_loc, output_mode, duplicate_paths, score=None):
+        """Table row for a match; the trailing dict (not shown) locates its context snippets"""
+        filename = os.path.basename(file_path)
+        locations = summarize_locations(offsets, occurrences)
+        duplicate_paths = ', '.join(duplicate_paths)
+        tail = ([score] if score is not None else []) + [{'path': os.path.abspath(file_path), 'offsets': offsets}]
+        if not out_loc:
+            return [filename, occurrences, locations, "Not saved", duplicate_paths] + tail
+        try:
+            dest_path = os.path.join(out_loc, filename)
+            used_mode = materialize_file(file_path, dest_path, output_mode)
+            if used_mode != output_mode:
+                logging.warning(f"{output_mode} not possible for {filename}, copied instead")
+            return [filename, occurrences, locations, dest_path, duplicate_paths] + tail
         except Exception as e:
-            logging.error(f"Error processing {file_path}: {e}")
-            return 0, "Error"
+            self.error_occurred.emit(f"Failed to save {filename}: {str(e)}")
+            return None
 
     def stop(self):
         self.stop_search = True
@@ -161,11 +604,20 @@ class CSVThread(QThread):
     merge_complete = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, input_files, output_file, include_headers):
+    def __init__(self, input_files, output_file, include_headers, processes=0, schema='same', dedup=False,
+                 dedup_keys=None, sort_column=None, sort_type='text', output_format='csv', row_query=None):
         super().__init__()
         self.input_files = input_files
         self.output_file = output_file
         self.include_headers = include_headers
+        self.processes = processes
+        self.schema = schema
+        self.dedup = dedup
+        self.dedup_keys = dedup_keys
+        self.sort_column = sort_column
+        self.sort_type = sort_type
+        self.output_format = output_format
+        self.row_query = row_query
         self.stop_merge = False
 
     def run(self):
@@ -176,45 +628,26 @@ class CSVThread(QThread):
                 return
 
             self.update_progress.emit(0, "Starting CSV merge...")
-            headers = []
-            merged_data = []
-
-            for i, file_path in enumerate(self.input_files):
-                if self.stop_merge:
-                    break
-
-                self.update_progress.emit(int((i + 1) / total_files * 50),
-                                        f"Processing {os.path.basename(file_path)}...")
-
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    reader = csv.reader(f)
-                    file_headers = next(reader)
-
-                    if not headers:
-                        headers = file_headers
-                        if self.include_headers:
-                            merged_data.append(headers)
-                    elif file_headers != headers:
-                        self.error_occurred.emit(
-                            f"Header mismatch in {os.path.basename(file_path)}\n"
-                            f"Expected: {headers}\nFound: {file_headers}"
-                        )
-                        return
-
-                    for row in reader:
-                        merged_data.append(row)
-
-            self.update_progress.emit(75, "Writing merged file...")
-
-            with open(self.output_file, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerows(merged_data)
+            summary = merge_csv(self.input_files, self.output_file, self.include_headers,
+                                progress=self.report_progress, should_stop=lambda: self.stop_merge,
+                                processes=self.processes, schema=self.schema,
+                                dedup=self.dedup, dedup_keys=self.dedup_keys,
+                                sort_column=self.sort_column, sort_type=self.sort_type,
+                                output_format=self.output_format, row_query=self.row_query)
+            if summary is None:
+                return
 
-            self.merge_complete.emit(f"Successfully merged {total_files} files into:\n{self.output_file}")
+            self.merge_complete.emit(f"Successfully merged {summary} into:\n{self.output_file}")
 
+        except MergeError as e:
+            self.error_occurred.emit(str(e))
         except Exception as e:
             self.error_occurred.emit(f"CSV merge error: {str(e)}")
 
+    def report_progress(self, done_bytes, total_bytes, message):
+        percent = int(done_bytes / total_bytes * 100) if total_bytes else 100
+        self.update_progress.emit(percent, f"{message} ({done_bytes / 1048576:.1f} of {total_bytes / 1048576:.1f} MB)")
+
     def stop(self):
         self.stop_merge = True
         self.update_progress.emit(0, "CSV merge stopped")
@@ -225,7 +658,7 @@ class FileSearchApp(QWidget):
         super().__init__()
         self.search_thread = None
         self.csv_thread = None
-        self.supported_file_types = ('.txt', '.docx', '.xlsx', '.pdf')
+        self.supported_file_types = ('.txt', '.docx', '.xlsx', '.pdf', '.csv', '.tsv')
         self.file_timers = {}
         self.csv_files = []
         self.init_ui()
@@ -285,9 +718,15 @@ class FileSearchApp(QWidget):
         input_btn_layout.addWidget(self.input_button)
         input_btn_layout.addWidget(self.file_button)
         
+        self.workers_label = QLabel("Remote workers (optional, searched instead of the input above):")
+        self.workers_path = QLineEdit()
+        self.workers_path.setPlaceholderText("host:port=/path/on/worker; host:port=/path/on/worker")
+
         input_layout.addWidget(self.input_label)
         input_layout.addWidget(self.input_path)
         input_layout.addLayout(input_btn_layout)
+        input_layout.addWidget(self.workers_label)
+        input_layout.addWidget(self.workers_path)
         input_group.setLayout(input_layout)
         
         # Search Options
@@ -302,25 +741,93 @@ class FileSearchApp(QWidget):
         self.case_sensitive = QCheckBox("Case sensitive")
         self.whole_word = QCheckBox("Whole word only")
         self.use_regex = QCheckBox("Use regular expressions")
+        self.boolean_query = QCheckBox('Boolean query (AND, OR, NOT, "phrases", NEAR/n)')
+        self.dedup_check = QCheckBox("Search identical files only once (content hash)")
+        self.index_check = QCheckBox("Use trigram index (faster repeated and regex searches)")
+        self.summary_check = QCheckBox("Skip files whose stored summary rules out a match")
+        self.daemon_check = QCheckBox("Use the search daemon when it is running")
         
         file_type_layout = QHBoxLayout()
         file_type_layout.addWidget(QLabel("File Types:"))
         self.file_type_combo = QComboBox()
         self.file_type_combo.addItems([
-            "All Supported (.txt, .docx, .xlsx, .pdf)", 
+            "All Supported (.txt, .docx, .xlsx, .pdf, .csv, .tsv)", 
             "Text Files (.txt)", 
             "Word Documents (.docx)",
             "Excel Files (.xlsx)",
-            "PDF Documents (.pdf)"
+            "PDF Documents (.pdf)",
+            "CSV and TSV Files (.csv, .tsv)"
         ])
         file_type_layout.addWidget(self.file_type_combo)
+
+        schedule_layout = QHBoxLayout()
+        schedule_layout.addWidget(QLabel("Search order:"))
+        self.schedule_combo = QComboBox()
+        self.schedule_combo.addItems([
+            "Folder order",
+            "Smallest files first",
+            "Recently modified first",
+            "Priority folders first"
+        ])
+        self.schedule_combo.currentIndexChanged.connect(self.toggle_priority_dirs)
+        schedule_layout.addWidget(self.schedule_combo)
+        self.rank_check = QCheckBox("Rank by relevance (BM25), keep top")
+        self.rank_check.setToolTip("Score matches with BM25 and list only the best ones, highest first")
+        self.top_k = QSpinBox()
+        self.top_k.setRange(1, 100000)
+        self.top_k.setValue(DEFAULT_TOP_K)
+        self.top_k.setEnabled(False)
+        self.rank_check.stateChanged.connect(lambda state: self.top_k.setEnabled(bool(state)))
+        schedule_layout.addWidget(self.rank_check)
+        schedule_layout.addWidget(self.top_k)
+        self.priority_dirs = QLineEdit()
+        self.priority_dirs.setPlaceholderText("Priority folders, separated by ;")
+        self.priority_dirs.setEnabled(False)
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Per-file limits (0 = none):"))
+        self.file_time_budget = QSpinBox()
+        self.file_time_budget.setRange(0, 86400)
+        self.file_time_budget.setValue(120)
+        self.file_time_budget.setSuffix(" s")
+        self.file_size_budget = QSpinBox()
+        self.file_size_budget.setRange(0, 1048576)
+        self.file_size_budget.setValue(0)
+        self.file_size_budget.setSuffix(" MB")
+        budget_layout.addWidget(self.file_time_budget)
+        budget_layout.addWidget(self.file_size_budget)
+        budget_layout.addWidget(QLabel("Read-ahead:"))
+        self.prefetch_depth = QSpinBox()
+        self.prefetch_depth.setRange(0, 64)
+        self.prefetch_depth.setValue(DEFAULT_DEPTH)
+        self.prefetch_depth.setSuffix(" files")
+        self.prefetch_depth.setToolTip("Files read ahead in parallel; raise for network shares, 0 to disable")
+        budget_layout.addWidget(self.prefetch_depth)
+        budget_layout.addWidget(QLabel("Parser processes:"))
+        self.parse_processes = QSpinBox()
+        self.parse_processes.setRange(0, MAX_PROCESSES)
+        self.parse_processes.setValue(0)
+        self.parse_processes.setToolTip("Processes parsing PDF, Word and Excel files in parallel, 0 to parse in the search thread")
+        budget_layout.addWidget(self.parse_processes)
+        self.autotune_check = QCheckBox("Auto-tune")
+        self.autotune_check.setToolTip("Adjust read-ahead and parser processes during the search "
+                                       "(settings are remembered per folder)")
+        budget_layout.addWidget(self.autotune_check)
         
         options_layout.addWidget(self.search_label)
         options_layout.addWidget(self.search_text)
         options_layout.addWidget(self.case_sensitive)
         options_layout.addWidget(self.whole_word)
         options_layout.addWidget(self.use_regex)
+        options_layout.addWidget(self.boolean_query)
+        options_layout.addWidget(self.dedup_check)
+        options_layout.addWidget(self.index_check)
+        options_layout.addWidget(self.summary_check)
+        options_layout.addWidget(self.daemon_check)
         options_layout.addLayout(file_type_layout)
+        options_layout.addLayout(schedule_layout)
+        options_layout.addWidget(self.priority_dirs)
+        options_layout.addLayout(budget_layout)
         options_group.setLayout(options_layout)
         
         # Output Section
@@ -333,6 +840,18 @@ class FileSearchApp(QWidget):
         self.output_path.setPlaceholderText("Where to save matching files")
         self.output_button = QPushButton("Browse")
         self.output_button.clicked.connect(self.select_output_folder)
+
+        output_mode_layout = QHBoxLayout()
+        output_mode_layout.addWidget(QLabel("Output mode:"))
+        self.output_mode_combo = QComboBox()
+        self.output_mode_combo.addItems([
+            "Copy",
+            "Hardlink",
+            "Reflink (copy-on-write)",
+            "Symlink"
+        ])
+        self.output_mode_combo.setToolTip("Links and clones fall back to a copy across devices")
+        output_mode_layout.addWidget(self.output_mode_combo)
         
         # Expiration Settings
         self.expiration_check = QCheckBox("Enable file expiration")
@@ -362,6 +881,7 @@ class FileSearchApp(QWidget):
         output_layout.addWidget(self.output_label)
         output_layout.addWidget(self.output_path)
         output_layout.addWidget(self.output_button)
+        output_layout.addLayout(output_mode_layout)
         output_layout.addWidget(self.expiration_check)
         output_layout.addLayout(expiration_time_layout)
         output_layout.addLayout(expiration_folder_layout)
@@ -374,10 +894,14 @@ class FileSearchApp(QWidget):
         self.stop_button = QPushButton("Stop")
         self.stop_button.clicked.connect(self.stop_searching)
         self.stop_button.setEnabled(False)
+        self.resume_button = QPushButton("Resume")
+        self.resume_button.setToolTip("Continue the last stopped search with the same settings")
+        self.resume_button.clicked.connect(self.resume_search)
         self.export_button = QPushButton("Export Results")
         self.export_button.clicked.connect(self.export_results)
         action_layout.addWidget(self.search_button)
         action_layout.addWidget(self.stop_button)
+        action_layout.addWidget(self.resume_button)
         action_layout.addWidget(self.export_button)
         
         # Progress Bar
@@ -390,13 +914,20 @@ class FileSearchApp(QWidget):
         
         # Results Table
         self.result_table = QTableWidget()
-        self.result_table.setColumnCount(4)
-        self.result_table.setHorizontalHeaderLabels(["File Name", "Occurrences", "Locations", "Saved To"])
+        self.result_table.setColumnCount(6)
+        self.result_table.setHorizontalHeaderLabels(["File Name", "Occurrences", "Locations", "Saved To", "Duplicates",
+                                                     "Score"])
         self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.result_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         self.result_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
         self.result_table.setMinimumHeight(300)
         self.result_table.verticalHeader().setDefaultSectionSize(30)
+        self.result_table.itemSelectionChanged.connect(self.show_match_context)
+
+        # Match context for the selected row, read from the file on demand
+        self.context_view = QTextBrowser()
+        self.context_view.setPlaceholderText("Select a result to see its matches in context")
+        self.context_view.setMaximumHeight(160)
         
         # Add widgets to layout
         layout.addWidget(input_group)
@@ -405,6 +936,7 @@ class FileSearchApp(QWidget):
         layout.addLayout(action_layout)
         layout.addWidget(self.progress)
         layout.addWidget(self.result_table)
+        layout.addWidget(self.context_view)
         layout.addWidget(self.status_bar)
         layout.addStretch()
         
@@ -440,6 +972,82 @@ class FileSearchApp(QWidget):
         self.csv_include_headers = QCheckBox("Include headers in output")
         self.csv_include_headers.setChecked(True)
         csv_merge_options.addWidget(self.csv_include_headers)
+        csv_merge_options.addWidget(QLabel("Output format:"))
+        self.csv_output_format = QComboBox()
+        self.csv_output_format.addItems([
+            "CSV",
+            "CSV, gzip compressed",
+            "CSV, zstd compressed",
+            "Parquet"
+        ])
+        self.csv_output_format.setToolTip("zstd needs the zstandard package, Parquet needs pyarrow")
+        csv_merge_options.addWidget(self.csv_output_format)
+        csv_merge_options.addWidget(QLabel("Parser processes:"))
+        self.csv_processes = QSpinBox()
+        self.csv_processes.setRange(0, MAX_PROCESSES)
+        self.csv_processes.setValue(MAX_PROCESSES if MAX_PROCESSES > 1 else 0)
+        self.csv_processes.setToolTip("Processes parsing large merges in parallel, 0 to parse in the merge thread")
+        csv_merge_options.addWidget(self.csv_processes)
+        csv_merge_options.addWidget(QLabel("Columns:"))
+        self.csv_schema_combo = QComboBox()
+        self.csv_schema_combo.addItems([
+            "Headers must match",
+            "All columns (union)",
+            "Common columns only"
+        ])
+        self.csv_schema_combo.setToolTip("How to merge files whose headers differ; missing columns are left blank")
+        csv_merge_options.addWidget(self.csv_schema_combo)
+
+        csv_dedup_options = QHBoxLayout()
+        csv_dedup_options.addWidget(QLabel("Duplicates:"))
+        self.csv_dedup_combo = QComboBox()
+        self.csv_dedup_combo.addItems([
+            "Keep duplicate rows",
+            "Remove duplicate rows",
+            "Remove rows with duplicate key columns"
+        ])
+        self.csv_dedup_combo.setToolTip("Keeps the first of each set of duplicates")
+        csv_dedup_options.addWidget(self.csv_dedup_combo)
+        self.csv_dedup_keys = QLineEdit()
+        self.csv_dedup_keys.setPlaceholderText("Key columns, separated by ,")
+        self.csv_dedup_keys.setEnabled(False)
+        self.csv_dedup_combo.currentIndexChanged.connect(lambda index: self.csv_dedup_keys.setEnabled(index == 2))
+        csv_dedup_options.addWidget(self.csv_dedup_keys)
+
+        csv_sort_options = QHBoxLayout()
+        self.csv_sort_check = QCheckBox("Sort by column")
+        self.csv_sort_check.setToolTip("Order the merged rows by one column; large merges are sorted in temporary runs")
+        csv_sort_options.addWidget(self.csv_sort_check)
+        self.csv_sort_column = QLineEdit()
+        self.csv_sort_column.setPlaceholderText("Column name")
+        self.csv_sort_column.setEnabled(False)
+        csv_sort_options.addWidget(self.csv_sort_column)
+        self.csv_sort_type = QComboBox()
+        self.csv_sort_type.addItems([
+            "As text",
+            "As numbers",
+            "As dates (ISO or day first)"
+        ])
+        self.csv_sort_type.setEnabled(False)
+        csv_sort_options.addWidget(self.csv_sort_type)
+        self.csv_sort_check.stateChanged.connect(self.toggle_csv_sort)
+
+        csv_filter_options = QHBoxLayout()
+        csv_filter_options.addWidget(QLabel("Keep rows matching:"))
+        self.csv_filter_text = QLineEdit()
+        self.csv_filter_text.setPlaceholderText("Search text (empty keeps every row)")
+        self.csv_filter_text.setToolTip("Only rows where a field matches are merged; "
+                                        "rows without the query's literal text are not parsed")
+        csv_filter_options.addWidget(self.csv_filter_text)
+        self.csv_filter_columns = QLineEdit()
+        self.csv_filter_columns.setPlaceholderText("In columns, separated by , (empty for all)")
+        csv_filter_options.addWidget(self.csv_filter_columns)
+        self.csv_filter_case = QCheckBox("Case sensitive")
+        self.csv_filter_whole_word = QCheckBox("Whole word only")
+        self.csv_filter_regex = QCheckBox("Regex")
+        csv_filter_options.addWidget(self.csv_filter_case)
+        csv_filter_options.addWidget(self.csv_filter_whole_word)
+        csv_filter_options.addWidget(self.csv_filter_regex)
 
         csv_merge_action_layout = QHBoxLayout()
         self.csv_merge_button = QPushButton("Merge CSV Files")
@@ -454,6 +1062,9 @@ class FileSearchApp(QWidget):
         csv_merge_layout.addWidget(self.csv_files_path)
         csv_merge_layout.addLayout(csv_merge_btn_layout)
         csv_merge_layout.addLayout(csv_merge_options)
+        csv_merge_layout.addLayout(csv_dedup_options)
+        csv_merge_layout.addLayout(csv_sort_options)
+        csv_merge_layout.addLayout(csv_filter_options)
         csv_merge_layout.addLayout(csv_merge_action_layout)
         csv_merge_group.setLayout(csv_merge_layout)
 
@@ -478,6 +1089,9 @@ class FileSearchApp(QWidget):
         self.expiration_folder.setEnabled(enabled)
         self.expiration_folder_button.setEnabled(enabled)
 
+    def toggle_priority_dirs(self, index):
+        self.priority_dirs.setEnabled(SCHEDULE_POLICIES[index] == 'priority')
+
     def select_input_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Input Folder")
         if folder:
@@ -486,7 +1100,7 @@ class FileSearchApp(QWidget):
     def select_input_file(self):
         file, _ = QFileDialog.getOpenFileName(
             self, "Select File", "", 
-            "Supported Files (*.txt *.docx *.xlsx *.pdf);;All Files (*)"
+            "Supported Files (*.txt *.docx *.xlsx *.pdf *.csv *.tsv);;All Files (*)"
         )
         if file:
             self.input_path.setText(file)
@@ -502,12 +1116,12 @@ class FileSearchApp(QWidget):
             self.expiration_folder.setText(folder)
             os.makedirs(folder, exist_ok=True)
 
-    def start_search(self):
+    def start_search(self, resume=False):
         source_loc = self.input_path.text()
         out_loc = self.output_path.text()
         search_string = self.search_text.text()
 
-        if not source_loc:
+        if not source_loc and not self.workers_path.text().strip():
             QMessageBox.warning(self, "Missing Input", "Please select input location!")
             return
 
@@ -516,7 +1130,7 @@ class FileSearchApp(QWidget):
             return
 
         selected_type = self.file_type_combo.currentText()
-        if selected_type == "All Supported (.txt, .docx, .xlsx, .pdf)":
+        if selected_type == "All Supported (.txt, .docx, .xlsx, .pdf, .csv, .tsv)":
             file_types = self.supported_file_types
         elif selected_type == "Text Files (.txt)":
             file_types = ('.txt',)
@@ -526,6 +1140,8 @@ class FileSearchApp(QWidget):
             file_types = ('.xlsx',)
         elif selected_type == "PDF Documents (.pdf)":
             file_types = ('.pdf',)
+        elif selected_type == "CSV and TSV Files (.csv, .tsv)":
+            file_types = ('.csv', '.tsv')
 
         search_params = {
             'source_loc': source_loc,
@@ -534,7 +1150,24 @@ class FileSearchApp(QWidget):
             'case_sensitive': self.case_sensitive.isChecked(),
             'whole_word': self.whole_word.isChecked(),
             'use_regex': self.use_regex.isChecked(),
-            'file_types': file_types
+            'boolean_query': self.boolean_query.isChecked(),
+            'file_types': file_types,
+            'output_mode': OUTPUT_MODES[self.output_mode_combo.currentIndex()],
+            'dedup': self.dedup_check.isChecked(),
+            'use_index': self.index_check.isChecked(),
+            'use_summaries': self.summary_check.isChecked(),
+            'use_daemon': self.daemon_check.isChecked(),
+            'workers': self.workers_path.text().strip(),
+            'schedule': SCHEDULE_POLICIES[self.schedule_combo.currentIndex()],
+            'priority_dirs': [d.strip() for d in self.priority_dirs.text().split(';') if d.strip()],
+            'file_time_budget': self.file_time_budget.value(),
+            'file_size_budget': self.file_size_budget.value() * 1024 * 1024,
+            'prefetch_depth': self.prefetch_depth.value(),
+            'rank_results': self.rank_check.isChecked(),
+            'top_k': self.top_k.value(),
+            'parse_processes': self.parse_processes.value(),
+            'autotune': self.autotune_check.isChecked(),
+            'resume': resume
         }
 
         self.result_table.setRowCount(0)
@@ -546,9 +1179,13 @@ class FileSearchApp(QWidget):
         self.search_thread.error_occurred.connect(self.handle_error)
         
         self.search_button.setEnabled(False)
+        self.resume_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.search_thread.start()
 
+    def resume_search(self):
+        self.start_search(resume=True)
+
     def stop_searching(self):
         if self.search_thread and self.search_thread.isRunning():
             self.search_thread.stop()
@@ -560,6 +1197,7 @@ class FileSearchApp(QWidget):
 
     def search_completed(self, results):
         self.search_button.setEnabled(True)
+        self.resume_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         self.progress.setValue(100)
         
@@ -569,12 +1207,15 @@ class FileSearchApp(QWidget):
             return
 
         self.update_table(results)
-        self.status_bar.setText(f"Search completed - {len(results)} matches found")
+        status = f"Search completed - {len(results)} matches found"
+        if self.search_thread and self.search_thread.time_to_first_result is not None:
+            status += f" (first result after {self.search_thread.time_to_first_result:.2f}s)"
+        self.status_bar.setText(status)
 
         # Schedule expiration for saved files if enabled
         if self.expiration_check.isChecked() and self.output_path.text() and self.expiration_folder.text():
             for row_data in results:
-                if row_data[3] != "Not saved":
+                if os.path.isfile(row_data[3]):
                     file_path = row_data[3]
                     self.schedule_file_expiration(file_path)
 
@@ -658,19 +1299,45 @@ class FileSearchApp(QWidget):
         self.status_bar.setText(f"Error: {error_msg}")
         QMessageBox.critical(self, "Error", error_msg)
         self.search_button.setEnabled(True)
+        self.resume_button.setEnabled(True)
         self.stop_button.setEnabled(False)
 
     def update_table(self, file_list):
         self.result_table.setRowCount(len(file_list))
+        self.context_view.clear()
         for row, data in enumerate(file_list):
-            for col, value in enumerate(data):
+            details = next((value for value in data if isinstance(value, dict)), None)
+            for col, value in enumerate(value for value in data if not isinstance(value, dict)):
                 item = QTableWidgetItem(str(value))
-                if col == 1:
+                if col in (1, 5):
                     item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+                if col == 0 and details:
+                    item.setData(Qt.ItemDataRole.UserRole, details)
                 self.result_table.setItem(row, col, item)
         
         self.result_table.resizeRowsToContents()
 
+    def show_match_context(self):
+        """Show context snippets of the selected row's matches, reading only the units involved"""
+        rows = self.result_table.selectionModel().selectedRows()
+        item = self.result_table.item(rows[0].row(), 0) if rows else None
+        details = item.data(Qt.ItemDataRole.UserRole) if item else None
+        if not details or not details.get('offsets'):
+            self.context_view.clear()
+            return
+        try:
+            snippets = match_context(details['path'], details['offsets'])
+        except Exception as e:
+            logging.error(f"Could not read context from {details['path']}: {e}")
+            self.context_view.setPlainText(f"Could not read {details['path']}: {e}")
+            return
+        parts = []
+        for location, before, match, after in snippets:
+            parts.append(f"<b>{html.escape(location)}</b>: &hellip;{html.escape(before)}"
+                         f"<span style='background-color: #b58900; color: #000000;'>{html.escape(match)}</span>"
+                         f"{html.escape(after)}&hellip;")
+        self.context_view.setHtml('<br>'.join(parts))
+
     def export_results(self):
         if self.result_table.rowCount() == 0:
             QMessageBox.warning(self, "No Results", "Nothing to export - no search results available")
@@ -707,12 +1374,21 @@ class FileSearchApp(QWidget):
     def select_csv_files(self):
         files, _ = QFileDialog.getOpenFileNames(
             self, "Select CSV Files", "",
-            "CSV Files (*.csv);;All Files (*)"
+            "CSV Files (*.csv *.tsv);;All Files (*)"
         )
         if files:
             self.csv_files = files
             self.csv_files_path.setText(f"{len(files)} files selected")
-            self.csv_status_bar.setText(f"Selected {len(files)} CSV files")
+            try:
+                detected = dialect_notes(files, detect_dialects(files))
+                self.csv_status_bar.setText(f"Selected {len(files)} CSV files\n" + '\n'.join(detected))
+            except OSError as e:
+                logging.error(f"Could not detect CSV formats: {e}")
+                self.csv_status_bar.setText(f"Selected {len(files)} CSV files")
+
+    def toggle_csv_sort(self, state):
+        self.csv_sort_column.setEnabled(bool(state))
+        self.csv_sort_type.setEnabled(bool(state))
 
     def clear_csv_selection(self):
         self.csv_files = []
@@ -725,20 +1401,50 @@ class FileSearchApp(QWidget):
             QMessageBox.warning(self, "No Files", "Please select CSV files to merge first!")
             return
 
+        dedup_keys = [key.strip() for key in self.csv_dedup_keys.text().split(',') if key.strip()]
+        if self.csv_dedup_combo.currentIndex() == 2 and not dedup_keys:
+            QMessageBox.warning(self, "No Key Columns", "Please enter the key columns to compare!")
+            return
+
+        sort_column = self.csv_sort_column.text().strip() if self.csv_sort_check.isChecked() else None
+        if sort_column == "":
+            QMessageBox.warning(self, "No Sort Column", "Please enter the column to sort by!")
+            return
+
+        row_query = None
+        if self.csv_filter_text.text():
+            row_query = {
+                'search_string': self.csv_filter_text.text(),
+                'case_sensitive': self.csv_filter_case.isChecked(),
+                'whole_word': self.csv_filter_whole_word.isChecked(),
+                'use_regex': self.csv_filter_regex.isChecked(),
+                'columns': [name.strip() for name in self.csv_filter_columns.text().split(',') if name.strip()],
+            }
+
+        output_format = OUTPUT_FORMATS[self.csv_output_format.currentIndex()]
+        extension = '.' + output_format
         output_file, _ = QFileDialog.getSaveFileName(
             self, "Save Merged CSV File", "",
-            "CSV Files (*.csv);;All Files (*)"
+            f"{self.csv_output_format.currentText()} (*{extension});;All Files (*)"
         )
         if not output_file:
             return
 
-        if not output_file.lower().endswith('.csv'):
-            output_file += '.csv'
+        if not output_file.lower().endswith(extension):
+            output_file += extension
 
         self.csv_thread = CSVThread(
             self.csv_files,
             output_file,
-            self.csv_include_headers.isChecked()
+            self.csv_include_headers.isChecked(),
+            self.csv_processes.value(),
+            SCHEMA_MODES[self.csv_schema_combo.currentIndex()],
+            self.csv_dedup_combo.currentIndex() > 0,
+            dedup_keys if self.csv_dedup_combo.currentIndex() == 2 else None,
+            sort_column,
+            SORT_TYPES[self.csv_sort_type.currentIndex()],
+            output_format,
+            row_query
         )
 
         self.csv_thread.update_progress.connect(self.update_csv_progress_status)
@@ -797,7 +1503,7 @@ class FileSearchApp(QWidget):
             QPushButton:pressed {
                 background-color: #2a2a2a;
             }
-            QLineEdit, QTableWidget, QComboBox, QSpinBox {
+            QLineEdit, QTableWidget, QComboBox, QSpinBox, QTextBrowser {
                 background-color: #3c3c3c;
                 border: 1px solid #555;
                 border-radius: 4px;
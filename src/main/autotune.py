@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import logging
+
+from prefetch import DEFAULT_DEPTH, MAX_DEPTH
+
+# Adjusts the read-ahead depth (I/O stage) and the number of parser
+# processes in flight (CPU stage) while a search runs. Every second it
+# looks at how long matching waited for reads, how busy the parser
+# processes were and how many files finished, then:
+#
+#   - doubles read-ahead while the matcher spends >25% of its time waiting
+#     on reads, and trims it when reads are always complete in advance
+#   - adds a parser process while they are >80% busy and documents are
+#     still queued, and removes one when they are <30% busy
+#   - undoes the last increase if throughput dropped by more than 10%
+#
+# Every change is appended to autotune.jsonl and the final settings are
+# kept per search root in autotune.json, which later searches of that root
+# start from.
+
+TUNING_DIR = os.path.join(os.path.expanduser('~'), '.file_search')
+WINDOW_SECONDS = 1.0
+
+
+def load_settings(root, directory=TUNING_DIR):
+    try:
+        with open(os.path.join(directory, 'autotune.json'), 'r', encoding='utf-8') as f:
+            return json.load(f).get(os.path.abspath(root), {})
+    except (OSError, ValueError):
+        return {}
+
+
+class Autotuner:
+    def __init__(self, root, prefetcher, parse_pool, directory=TUNING_DIR, report=None):
+        self.root = os.path.abspath(root)
+        self.prefetcher = prefetcher
+        self.parse_pool = parse_pool
+        self.directory = directory
+        self.report = report or (lambda message: None)
+        self.window_start = time.monotonic()
+        self.files = 0
+        self.last_rate = None
+        self.last_increase = None
+        self.baseline = self._counters()
+
+    def _counters(self):
+        return (self.prefetcher.wait_time, self.prefetcher.takes, self.prefetcher.ready_takes,
+                self.parse_pool.busy_time)
+
+    def file_done(self):
+        self.files += 1
+
+    def tick(self, documents_queued):
+        now = time.monotonic()
+        window = now - self.window_start
+        if window < WINDOW_SECONDS:
+            return
+        wait, takes, ready, busy = (a - b for a, b in zip(self._counters(), self.baseline))
+        rate = self.files / window
+        io_wait = wait / window
+        ready_ratio = ready / takes if takes else 0.0
+        cpu_busy = busy / (window * self.parse_pool.slots) if self.parse_pool.slots else 0.0
+        depth, slots = self.prefetcher.depth, self.parse_pool.slots
+
+        if self.last_increase and self.last_rate and rate < self.last_rate * 0.9:
+            stage, previous = self.last_increase
+            if stage == 'io':
+                depth = previous
+            else:
+                slots = previous
+            self.last_increase = None
+        else:
+            self.last_increase = None
+            if io_wait > 0.25 and depth < MAX_DEPTH:
+                self.last_increase = ('io', depth)
+                depth = min(MAX_DEPTH, depth * 2)
+            elif takes and ready_ratio > 0.9 and depth > DEFAULT_DEPTH // 2:
+                depth -= 1
+            if documents_queued and cpu_busy > 0.8 and slots < self.parse_pool.max_processes:
+                self.last_increase = self.last_increase or ('cpu', slots)
+                slots += 1
+            elif cpu_busy < 0.3 and slots > 1:
+                slots -= 1
+
+        if (depth, slots) != (self.prefetcher.depth, self.parse_pool.slots):
+            self.prefetcher.set_depth(depth)
+            self.parse_pool.set_slots(slots)
+            self._log({'time': time.time(), 'root': self.root, 'io_depth': depth, 'cpu_slots': slots,
+                       'files_per_sec': round(rate, 2), 'io_wait': round(io_wait, 3),
+                       'cpu_busy': round(cpu_busy, 3), 'reads_ready': round(ready_ratio, 3)})
+            self.report(f"Autotune: read-ahead {depth}, parser processes {slots} ({rate:.1f} files/s)")
+
+        self.last_rate = rate
+        self.files = 0
+        self.window_start = now
+        self.baseline = self._counters()
+
+    def _log(self, record):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, 'autotune.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logging.error(f"Could not write autotune log: {e}")
+
+    def save(self):
+        """Remember the final settings as the starting point for this root"""
+        path = os.path.join(self.directory, 'autotune.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            settings = {}
+        settings[self.root] = {'io_depth': self.prefetcher.depth, 'cpu_slots': self.parse_pool.slots}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(settings, f, indent=1)
+        except OSError as e:
+            logging.error(f"Could not save autotune settings: {e}")
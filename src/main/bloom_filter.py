@@ -0,0 +1,137 @@
+import os
+import re
+import math
+import sqlite3
+import hashlib
+
+from trigram_index import ALL, text_trigrams
+
+# Per-file Bloom filter summaries. While a file is searched, its lower-cased
+# words and byte trigrams go into a Bloom filter that is kept in a SQLite
+# sidecar keyed by path, size and mtime. A later search can then rule a
+# file out without opening it: every trigram the query requires (see
+# trigram_index.regex_query) and, for whole words, every word must be in
+# the filter. False positives just mean the file is searched as usual.
+#
+# At 8 bits and 3 hashes per item a single lookup has about a 3% false
+# positive rate for one byte per distinct word or trigram; queries need
+# several trigrams, so whole queries pass by mistake far less often.
+# Building a filter costs a little over a microsecond per item, which is
+# noticeable next to plain text files but small next to parsing documents.
+
+SUMMARY_DB = os.path.join(os.path.expanduser('~'), '.file_search', 'summaries.sqlite')
+BITS_PER_ITEM = 8
+HASHES = 3
+WORD_RE = re.compile(r'\w+')
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes=HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.size = len(bits) * 8
+
+    @classmethod
+    def from_items(cls, items):
+        size = max(64, math.ceil(len(items) * BITS_PER_ITEM / 8) * 8)
+        bits = bytearray(size // 8)
+        # Same positions as _positions(), inlined: this loop runs once per
+        # distinct word and trigram of every summarized file.
+        for item in items:
+            digest = int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'little')
+            h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+            for i in range(HASHES):
+                position = (h1 + i * h2) % size
+                bits[position >> 3] |= 1 << (position & 7)
+        return cls(bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[1:], data[0])
+
+    def to_bytes(self):
+        return bytes([self.hashes]) + bytes(self.bits)
+
+    def _positions(self, item):
+        digest = int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'little')
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class SummaryBuilder:
+    """Collects the words and trigrams of a file's text as it is searched"""
+
+    def __init__(self):
+        self.items = set()
+        self.complete = False
+
+    def add_text(self, text):
+        self.items.update(b'w' + word.encode('utf-8') for word in WORD_RE.findall(text.lower()))
+        self.items.update(b't' + trigram for trigram in text_trigrams(text))
+
+    def build(self):
+        return BloomFilter.from_items(self.items).to_bytes()
+
+
+def required_words(search_string, whole_word, use_regex):
+    """Words a literal search needs to find as complete words"""
+    if use_regex:
+        return []
+    words = WORD_RE.findall(search_string.lower())
+    if whole_word:
+        return words
+    # Without whole-word matching the first and last word may be partial.
+    return words[1:-1]
+
+
+def may_match(bloom, query, words=()):
+    if any(b'w' + word.encode('utf-8') not in bloom for word in words):
+        return False
+    return _evaluate(bloom, query)
+
+
+def _evaluate(bloom, query):
+    if query == ALL:
+        return True
+    if isinstance(query, bytes):
+        return b't' + query in bloom
+    op, args = query
+    if op == 'and':
+        return all(_evaluate(bloom, sub) for sub in args)
+    return any(_evaluate(bloom, sub) for sub in args)
+
+
+class SummaryStore:
+    def __init__(self, path=SUMMARY_DB, commit_every=500):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS summaries '
+                        '(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, bloom BLOB)')
+        self.commit_every = commit_every
+        self.uncommitted = 0
+
+    def get(self, file_path, signature):
+        if not signature:
+            return None
+        row = self.db.execute('SELECT size, mtime, bloom FROM summaries WHERE path = ?',
+                              (os.path.abspath(file_path),)).fetchone()
+        if row and tuple(row[:2]) == tuple(signature):
+            return BloomFilter.from_bytes(row[2])
+        return None
+
+    def put(self, file_path, signature, summary):
+        if not signature:
+            return
+        self.db.execute('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+                        (os.path.abspath(file_path), signature[0], signature[1], summary))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,1359 @@
+import io
+import os
+import re
+import csv
+import json
+import zlib
+import queue
+import heapq
+import shutil
+import codecs
+import pickle
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import itertools
+import collections
+from datetime import datetime, timezone
+from operator import itemgetter
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from search_engine import build_regex, raw_prefilter, well_formed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Streaming CSV merge. Rows go from each input's reader straight to the
+# output writer in blocks through large buffers, so memory use does not
+# depend on the size of the inputs. Progress is measured in input bytes.
+# The output is written to a temporary file next to the target and only
+# renamed into place when the merge completes.
+#
+# When every input has the same one-line header and line terminator, the
+# rows are not parsed at all: each file's body is copied byte for byte
+# (with copy_file_range where the OS has it), dropping BOMs and adding a
+# missing final newline at file boundaries. Anything else is parsed.
+#
+# Parsing (and any per-row transform) can run in worker processes: files
+# are cut into chunks after a newline that has an even number of quotes
+# before it, each chunk is parsed and re-serialized by a worker, and the
+# results are written strictly in submission order, so the output is the
+# same as a single-threaded merge. A worker detects a chunk that was cut
+# inside a quoted field (stray quotes in unquoted fields upset the count),
+# and the merge then starts over in one thread.
+#
+# Each input's encoding (BOM, UTF-16 without one, UTF-8, else cp1252) and
+# csv dialect (delimiter, quote character) are sniffed from its first
+# SNIFF_BYTES and cached by path, size and mtime, so repeated merges do not
+# read the samples again. The output is always UTF-8 with commas; only
+# inputs already in that form can be copied as raw bytes, and UTF-16/32
+# inputs cannot be cut into chunks for the parser processes.
+#
+# Headers are read in a pre-pass before any rows are touched. Files must
+# share one header unless the merge aligns columns to the union or the
+# intersection of all headers, in which case each file whose columns differ
+# gets an index vector that rearranges its rows on the way through.
+#
+# Duplicate rows (whole rows or rows with the same key columns) can be
+# dropped, keeping the first. Row digests live in a set until the memory
+# budget is used up; after that rows are spilled to files partitioned by
+# digest, each partition is deduplicated on its own and the survivors are
+# merged back in their original order.
+#
+# A sorted merge orders rows by one column compared as text, numbers or
+# dates. Inputs that are each already sorted are k-way merged as they are
+# read; otherwise rows are sorted in memory up to a budget, spilled as
+# sorted runs to temporary files and the runs are k-way merged with a heap.
+#
+# The output can be plain CSV, CSV compressed with gzip or zstd (needs the
+# zstandard package) or Parquet (needs pyarrow, all columns as strings,
+# written in row groups). Compression and Parquet encoding happen on a
+# background thread that the merge hands large buffers to, so they overlap
+# with reading and parsing.
+#
+# A merge can keep only the rows matching a search-tab query (literal or
+# regex, case and whole-word options), in any field or in chosen columns.
+# Filtered merges always go through chunks: the raw text of each chunk is
+# searched for the literal every match must contain, and only the records
+# around the hits are parsed and tested against the full query.
+
+BUFFER_SIZE = 1024 * 1024
+BLOCK_ROWS = 10000
+COPY_CHUNK = 64 * 1024 * 1024
+MAX_HEADER_BYTES = 1024 * 1024
+CHUNK_BYTES = 8 * 1024 * 1024
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+MAX_BUFFERED = 256 * 1024 * 1024
+SENTINEL = '\x1e\x1f'
+DEDUP_MEMORY = 256 * 1024 * 1024
+DIGEST_ENTRY_BYTES = 100
+PARTITIONS = 256
+RECORD = struct.Struct('<16sQI')
+SORT_MEMORY = 256 * 1024 * 1024
+SORT_ENTRY_BYTES = 150
+SORT_TYPES = ('text', 'number', 'date')
+OUTPUT_FORMATS = ('csv', 'csv.gz', 'csv.zst', 'parquet')
+WRITER_QUEUE = 8
+ROW_GROUP_BYTES = 64 * 1024 * 1024
+PREFILTER_MAX_SHARE = 4
+DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d.%m.%Y', '%d.%m.%Y %H:%M',
+                '%d-%b-%Y', '%d %b %Y', '%Y/%m/%d', '%Y/%m/%d %H:%M:%S')
+
+
+class MergeError(Exception):
+    """A problem with the inputs that stops the merge, with a message for the user"""
+
+
+class SplitError(Exception):
+    """A chunk boundary fell inside a quoted field"""
+
+
+class OutOfOrder(Exception):
+    """An input expected to be sorted was not"""
+
+
+class MergeSummary:
+    """What a merge did; rows is None when the files were copied without parsing"""
+
+    def __init__(self, files):
+        self.files = files
+        self.rows = None
+        self.copied = False
+        self.removed = None
+        self.notes = []
+
+    def __str__(self):
+        files = f"{self.files} files"
+        if self.copied:
+            text = f"{files} (copied without parsing)"
+        elif self.removed is not None:
+            text = f"{files} ({self.rows} rows, {self.removed} duplicates removed)"
+        else:
+            text = f"{files} ({self.rows} rows)"
+        return text + ''.join(f"\n{note}" for note in self.notes)
+
+
+# -------------------- Dialects --------------------
+DIALECT_CACHE = os.path.join(os.path.expanduser('~'), '.file_search', 'csv_dialects.json')
+DIALECT_CACHE_VERSION = 2  # bumped whenever sniffing changes, so older results are not reused
+DIALECT_CACHE_ENTRIES = 10000
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ',;\t|'
+DELIMITER_NAMES = {',': 'comma', ';': 'semicolon', '\t': 'tab', '|': 'pipe'}
+BOMS = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'), (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+
+class FileDialect:
+    """Encoding and csv format of one input file"""
+
+    def __init__(self, encoding='utf-8-sig', delimiter=',', quotechar='"', skipinitialspace=False, detected=True):
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.skipinitialspace = skipinitialspace
+        self.detected = detected
+
+    def options(self):
+        """Keyword arguments for csv.reader"""
+        return {'delimiter': self.delimiter, 'quotechar': self.quotechar, 'skipinitialspace': self.skipinitialspace}
+
+    def plain(self):
+        """Whether the file is already in the output format: UTF-8, commas, double quotes"""
+        return self.encoding in ('utf-8', 'utf-8-sig') and self.options() == FileDialect().options()
+
+    def splittable(self):
+        """Whether newline and quote bytes can be found without decoding (not UTF-16 or UTF-32)"""
+        return not self.encoding.startswith(('utf-16', 'utf-32'))
+
+    def __str__(self):
+        text = f"{DELIMITER_NAMES.get(self.delimiter, repr(self.delimiter))}, "
+        text += 'UTF-8' if self.encoding == 'utf-8-sig' else codecs.lookup(self.encoding).name.upper()
+        if self.quotechar != '"':
+            text += f", quoted with {self.quotechar}"
+        if not self.detected:
+            text += " (format not detected, guessed from the header)"
+        return text
+
+
+def detect_encoding(sample):
+    """Encoding of a file from its first bytes: a BOM, NUL bytes of UTF-16 text, UTF-8 if it decodes, else cp1252"""
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    half = len(sample) // 2
+    if half:
+        even_nuls, odd_nuls = sample[0::2].count(0), sample[1::2].count(0)
+        if odd_nuls > half // 3 and even_nuls < half // 10:
+            return 'utf-16-le'
+        if even_nuls > half // 3 and odd_nuls < half // 10:
+            return 'utf-16-be'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def sniff_dialect(file_path):
+    """FileDialect of a file, sniffed from its first SNIFF_BYTES"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    encoding = detect_encoding(sample)
+    text = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(sample)
+    if len(sample) == SNIFF_BYTES and '\n' in text:
+        text = text[:text.rfind('\n') + 1]
+    try:
+        sniffed = csv.Sniffer().sniff(text, SNIFF_DELIMITERS)
+    except csv.Error:
+        return FileDialect(encoding, header_delimiter(text, file_path), detected=False)
+    # The Sniffer often guesses skipinitialspace from a few quoted fields,
+    # which would strip meaningful leading spaces everywhere else.
+    delimiter = sniffed.delimiter
+    skip_space = bool(sniffed.skipinitialspace) and text.count(delimiter) == text.count(delimiter + ' ')
+    return FileDialect(encoding, delimiter, sniffed.quotechar or '"', skip_space)
+
+
+def header_delimiter(text, file_path):
+    """The delimiter seen most often outside quotes on the first line, else tab for .tsv and comma otherwise"""
+    line = re.sub(r'"[^"]*"', '', text.split('\n', 1)[0])
+    counts = {d: line.count(d) for d in SNIFF_DELIMITERS}
+    best = max(SNIFF_DELIMITERS, key=counts.get)
+    if counts[best]:
+        return best
+    return '\t' if file_path.lower().endswith('.tsv') else ','
+
+
+def detect_dialects(input_files, cache_path=DIALECT_CACHE):
+    """FileDialect per input, from the cache when the file's size and mtime are unchanged"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        cache = stored['files'] if stored.get('version') == DIALECT_CACHE_VERSION else {}
+    except (OSError, ValueError, KeyError, AttributeError):
+        cache = {}
+    dialects = []
+    changed = False
+    for file_path in input_files:
+        key = os.path.abspath(file_path)
+        st = os.stat(file_path)
+        signature = [st.st_size, st.st_mtime_ns]
+        entry = cache.pop(key, None)
+        if entry and entry[:2] == signature:
+            dialect = FileDialect(**entry[2])
+        else:
+            dialect = sniff_dialect(file_path)
+            changed = True
+        cache[key] = signature + [vars(dialect)]
+        dialects.append(dialect)
+    if changed:
+        for key in list(cache)[:max(0, len(cache) - DIALECT_CACHE_ENTRIES)]:
+            del cache[key]
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': DIALECT_CACHE_VERSION, 'files': cache}, f)
+        except OSError as e:
+            logging.error(f"Could not save CSV dialect cache: {e}")
+    return dialects
+
+
+def dialect_notes(input_files, dialects):
+    """One line per detected dialect naming the files read with it"""
+    groups = {}
+    for file_path, dialect in zip(input_files, dialects):
+        groups.setdefault(str(dialect), []).append(os.path.basename(file_path))
+    notes = []
+    for description, names in groups.items():
+        more = f" and {len(names) - 3} more" if len(names) > 3 else ""
+        notes.append(f"{', '.join(names[:3])}{more}: {description}")
+    return notes
+
+
+def open_csv(file_path, dialect=None):
+    """(raw binary file, text file for csv.reader); raw.tell() tracks bytes consumed"""
+    raw = open(file_path, 'rb', buffering=BUFFER_SIZE)
+    encoding = dialect.encoding if dialect else 'utf-8-sig'
+    return raw, io.TextIOWrapper(raw, encoding=encoding, errors='ignore', newline='')
+
+
+# -------------------- Schema --------------------
+SCHEMA_MODES = ('same', 'union', 'intersection')
+
+
+def read_header(file_path, dialect=None):
+    """First record of a CSV file, or None for an empty file"""
+    raw, f = open_csv(file_path, dialect)
+    with f:
+        return next(csv.reader(f, **(dialect or FileDialect()).options()), None)
+
+
+def column_keys(header):
+    """(name, n) per column, n counting earlier columns with the same name"""
+    seen = {}
+    keys = []
+    for name in header:
+        keys.append((name, seen.get(name, 0)))
+        seen[name] = seen.get(name, 0) + 1
+    return keys
+
+
+class SchemaPlan:
+    """Output columns of a merge and how each file's columns map onto them.
+
+    mode is 'same' (every header must match the first; raises MergeError
+    naming the offending files), 'union' or 'intersection'. dialects are the
+    inputs' FileDialects (plain CSV when left out). vectors maps the
+    index of each file whose columns differ to a source column index per
+    output column, len(file header) standing for a blank.
+    """
+
+    def __init__(self, input_files, mode='same', dialects=None):
+        self.columns = None
+        self.vectors = {}
+        self.notes = []
+        dialects = dialects or [None] * len(input_files)
+        headers = [read_header(path, dialect) for path, dialect in zip(input_files, dialects)]
+        present = [(os.path.basename(path), header) for path, header in zip(input_files, headers)
+                   if header is not None]
+        if not present:
+            return
+        first = present[0][1]
+
+        if mode == 'same':
+            mismatched = [(name, header) for name, header in present if header != first]
+            if mismatched:
+                name, found = mismatched[0]
+                more = f"\n(and {len(mismatched) - 1} more files)" if len(mismatched) > 1 else ""
+                raise MergeError(f"Header mismatch in {name}\nExpected: {first}\nFound: {found}{more}")
+            self.columns = first
+            return
+
+        key_lists = [column_keys(header) for _, header in present]
+        if mode == 'union':
+            keys = list(dict.fromkeys(key for file_keys in key_lists for key in file_keys))
+        else:
+            common = set(key_lists[0]).intersection(*key_lists[1:])
+            keys = [key for key in key_lists[0] if key in common]
+            if not keys:
+                raise MergeError("The files have no columns in common")
+        self.columns = [name for name, _ in keys]
+
+        wanted = set(keys)
+        for index, header in enumerate(headers):
+            if header is None:
+                continue
+            file_keys = column_keys(header)
+            if file_keys == keys:
+                continue
+            position = {key: i for i, key in enumerate(file_keys)}
+            self.vectors[index] = [position.get(key, len(header)) for key in keys]
+            missing = [name for name, n in keys if (name, n) not in position]
+            dropped = [name for name, n in file_keys if (name, n) not in wanted]
+            name = os.path.basename(input_files[index])
+            if missing:
+                self.notes.append(f"{name}: no {', '.join(missing)} (left blank)")
+            if dropped:
+                self.notes.append(f"{name}: {', '.join(dropped)} dropped")
+
+
+def remap_rows(rows, vector):
+    """Rows rearranged through an index vector; short rows are padded with blanks"""
+    width = max(vector) + 1
+    if len(vector) > 1:
+        get = itemgetter(*vector)
+    else:
+        get = lambda row: (row[vector[0]],)
+    remapped = []
+    for row in rows:
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        remapped.append(get(row))
+    return remapped
+
+
+class RowTransform:
+    """Per-row work on blocks of parsed rows, run in the merge thread or (pickled) in parser processes.
+
+    dedup is None, or a list of output column indexes to compare (empty
+    for whole rows), in which case encode also returns row digests. sort is
+    None or (column index, type) for the sort keys encode returns.
+    row_filter is None or a RowFilter that rows must pass.
+    """
+
+    def __init__(self, vectors=None, dedup=None, sort=None, row_filter=None):
+        self.vectors = vectors or {}
+        self.dedup = dedup
+        self.sort = sort
+        self.row_filter = row_filter
+
+    def active(self):
+        return (bool(self.vectors) or self.dedup is not None or self.sort is not None
+                or self.row_filter is not None)
+
+    def __call__(self, rows, file_index):
+        vector = self.vectors.get(file_index)
+        if vector is not None:
+            rows = remap_rows(rows, vector)
+        if self.row_filter is not None:
+            rows = self.row_filter.keep(rows)
+        return rows
+
+    def encode(self, rows):
+        """(CSV bytes, None), or (None, [(digest, sort key, CSV line)]) when removing duplicates or sorting"""
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if self.dedup is None and self.sort is None:
+            writer.writerows(rows)
+            return out.getvalue().encode('utf-8'), None
+
+        ends = []
+        for row in rows:
+            writer.writerow(row)
+            ends.append(out.tell())
+        text = out.getvalue()
+        records = []
+        start = 0
+        digest = key = None
+        for row, end in zip(rows, ends):
+            line = text[start:end]
+            start = end
+            if self.dedup is not None:
+                if self.dedup:
+                    line_key = '\x00'.join(row[i] if i < len(row) else '' for i in self.dedup)
+                else:
+                    line_key = line
+                digest = hashlib.blake2b(line_key.encode('utf-8'), digest_size=16).digest()
+            if self.sort is not None:
+                key = sort_key(row, *self.sort)
+            records.append((digest, key, line.encode('utf-8')))
+        return None, records
+
+
+def column_index(columns, name, label="Key column"):
+    """Index of a column name in the merged columns; raises MergeError for unknown names"""
+    if columns is None or name not in columns:
+        raise MergeError(f"{label} '{name}' is not in the merged columns")
+    return columns.index(name)
+
+
+def dedup_columns(columns, keys):
+    """Indexes of the key columns (names) in the merged columns; raises MergeError for unknown names"""
+    return [column_index(columns, key) for key in keys]
+
+
+# -------------------- Row Filter --------------------
+def record_end(text, start):
+    """End of the record starting at start: after the first newline with an even number of quotes before it"""
+    end = text.find('\n', start)
+    while end >= 0 and text.count('"', start, end) % 2:
+        end = text.find('\n', end + 1)
+    return len(text) if end < 0 else end + 1
+
+
+def record_start(text, floor, pos):
+    """Start of the record holding pos, given that a record starts at floor <= pos"""
+    start = text.rfind('\n', floor, pos) + 1 or floor
+    while start > floor and text.count('"', floor, start) % 2:
+        start = text.rfind('\n', floor, start - 1) + 1 or floor
+    return start
+
+
+class RowFilter:
+    """Keeps the rows where a search query matches a field, or one of the given columns.
+
+    The query takes the search tab's options and is compiled with
+    build_regex. Compiled patterns are not pickled; each parser process
+    compiles its own.
+    """
+
+    def __init__(self, search_string, case_sensitive=False, whole_word=False, use_regex=False, columns=None):
+        self.query = (search_string, case_sensitive, whole_word, use_regex)
+        self.columns = columns
+        self.regex = None
+        self.prefilter = None
+        self.compile()
+
+    def __getstate__(self):
+        return {**self.__dict__, 'regex': None, 'prefilter': None}
+
+    def compile(self):
+        """Build the regex (raises re.error) and the prefilter for its required literal"""
+        if self.regex is not None:
+            return
+        search_string, case_sensitive, whole_word, use_regex = self.query
+        self.regex = build_regex(search_string, case_sensitive, whole_word, use_regex)
+        self.prefilter = raw_prefilter(self.regex)
+
+    def keep(self, rows):
+        self.compile()
+        search = self.regex.search
+        if self.columns is None:
+            return [row for row in rows if any(search(field) for field in row)]
+        columns = self.columns
+        return [row for row in rows if any(search(row[i]) for i in columns if i < len(row))]
+
+    def candidates(self, text, start):
+        """Records of text from start on that contain the required literal.
+
+        None when there is no literal, or when so many lines hold it that
+        parsing everything is quicker. text must begin at a record boundary
+        and have an even number of quotes, or records are located wrongly.
+        """
+        self.compile()
+        if self.prefilter is None:
+            return None
+        search = self.prefilter.search
+        limit = text.count('\n', start) // PREFILTER_MAX_SHARE
+        records = []
+        match = search(text, start)
+        while match:
+            if len(records) > limit:
+                return None
+            begin = record_start(text, start, match.start())
+            start = record_end(text, begin)
+            records.append(text[begin:start])
+            match = search(text, start)
+        return records
+
+
+# -------------------- Sorting --------------------
+def parse_number(value):
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return None if number != number else number
+
+
+def parse_date(value):
+    """datetime for ISO 8601 or a DATE_FORMATS value (day first), in UTC when it has a zone"""
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def sort_key(row, index, sort_type):
+    """Sort key of a row; numbers and dates that do not parse sort after all others"""
+    value = row[index] if index < len(row) else ''
+    if sort_type == 'text':
+        return 0, value
+    parsed = parse_number(value) if sort_type == 'number' else parse_date(value)
+    return (1, '') if parsed is None else (0, parsed)
+
+
+def _runs(path):
+    """(key, line) pairs of a sorted run file"""
+    with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+class ExternalSorter:
+    """Sorts (key, line) pairs in memory up to a budget, spilling sorted runs to temporary files"""
+
+    def __init__(self, temp_parent, memory_budget=SORT_MEMORY):
+        self.temp_parent = temp_parent
+        self.memory_budget = memory_budget
+        self.buffer = []
+        self.buffered = 0
+        self.temp_dir = None
+        self.runs = []
+
+    def add(self, key, line):
+        self.buffer.append((key, line))
+        self.buffered += len(line) + SORT_ENTRY_BYTES
+        if self.buffered > self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix='.merge-sort-', dir=self.temp_parent)
+        self.buffer.sort(key=itemgetter(0))
+        path = os.path.join(self.temp_dir, f"run{len(self.runs)}")
+        with open(path, 'wb', buffering=BUFFER_SIZE) as f:
+            for i in range(0, len(self.buffer), BLOCK_ROWS):
+                pickle.dump(self.buffer[i:i + BLOCK_ROWS], f, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.buffer = []
+        self.buffered = 0
+
+    def finish(self, out, report, should_stop):
+        """Write all rows in key order; equal keys keep their input order. False if stopped"""
+        self.buffer.sort(key=itemgetter(0))
+        if self.runs:
+            report(f"Merging {len(self.runs) + 1} sorted runs...")
+        runs = [_runs(path) for path in self.runs] + [iter(self.buffer)]
+        for i, (_, line) in enumerate(heapq.merge(*runs, key=itemgetter(0))):
+            if i % BLOCK_ROWS == 0 and should_stop():
+                return False
+            out.write(line)
+        return True
+
+    def close(self):
+        self.buffer = []
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+# -------------------- Deduplication --------------------
+def _records(path):
+    """(digest, sequence, line) records of a spill file"""
+    with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            digest, seq, length = RECORD.unpack(head)
+            yield digest, seq, f.read(length)
+
+
+class Deduplicator:
+    """Passes on each row digest's first row; runs in the merge thread.
+
+    Rows are handed to emit(key, line); keyed says whether they carry sort
+    keys that have to survive a spill.
+    """
+
+    def __init__(self, temp_parent, keyed=False, memory_budget=DEDUP_MEMORY):
+        self.temp_parent = temp_parent
+        self.keyed = keyed
+        self.limit = max(1, memory_budget // DIGEST_ENTRY_BYTES)
+        self.seen = set()
+        self.removed = 0
+        self.temp_dir = None
+        self.partitions = None
+        self.seq = 0
+
+    def write(self, records, emit):
+        if self.partitions is None:
+            seen = self.seen
+            for digest, key, line in records:
+                if digest in seen:
+                    self.removed += 1
+                else:
+                    seen.add(digest)
+                    emit(key, line)
+            if len(seen) > self.limit:
+                self._spill()
+            return
+        for digest, key, line in records:
+            payload = pickle.dumps((key, line)) if self.keyed else line
+            self.partitions[digest[0]].write(RECORD.pack(digest, self.seq, len(payload)) + payload)
+            self.seq += 1
+
+    def _path(self, kind, partition):
+        return os.path.join(self.temp_dir, f"{kind}{partition}")
+
+    def _spill(self):
+        """Move the digest set to per-partition files and start spilling rows"""
+        self.temp_dir = tempfile.mkdtemp(prefix='.merge-dedup-', dir=self.temp_parent)
+        known = [open(self._path('seen', p), 'wb', buffering=64 * 1024) for p in range(PARTITIONS)]
+        for digest in self.seen:
+            known[digest[0]].write(digest)
+        for f in known:
+            f.close()
+        self.seen = set()
+        self.partitions = [open(self._path('rows', p), 'wb', buffering=64 * 1024) for p in range(PARTITIONS)]
+
+    def finish(self, emit, report, should_stop):
+        """Deduplicate the spilled partitions and pass on their rows in order; False if stopped"""
+        if self.partitions is None:
+            return True
+        for f in self.partitions:
+            f.close()
+        self.partitions = []
+        for p in range(PARTITIONS):
+            if should_stop():
+                return False
+            report(f"Removing duplicates ({p + 1} of {PARTITIONS})...")
+            with open(self._path('seen', p), 'rb') as f:
+                data = f.read()
+            seen = {data[i:i + 16] for i in range(0, len(data), 16)}
+            with open(self._path('kept', p), 'wb', buffering=BUFFER_SIZE) as kept:
+                for digest, seq, line in _records(self._path('rows', p)):
+                    if digest in seen:
+                        self.removed += 1
+                        continue
+                    seen.add(digest)
+                    kept.write(RECORD.pack(digest, seq, len(line)) + line)
+            os.remove(self._path('rows', p))
+            os.remove(self._path('seen', p))
+
+        report("Writing deduplicated rows...")
+        kept = [_records(self._path('kept', p)) for p in range(PARTITIONS)]
+        for i, (_, _, payload) in enumerate(heapq.merge(*kept, key=lambda record: record[1])):
+            if i % BLOCK_ROWS == 0 and should_stop():
+                return False
+            emit(*(pickle.loads(payload) if self.keyed else (None, payload)))
+        return True
+
+    def close(self):
+        for f in self.partitions or ():
+            f.close()
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+# -------------------- Output Formats --------------------
+class CompressedFile:
+    """Binary file compressing everything written to it (gzip or zstd)"""
+
+    def __init__(self, path, output_format):
+        if output_format == 'csv.gz':
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        else:
+            self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        self.f = open(path, 'wb', buffering=BUFFER_SIZE)
+
+    def write(self, data):
+        self.f.write(self.compressor.compress(data))
+
+    def close(self):
+        try:
+            self.f.write(self.compressor.flush())
+        finally:
+            self.f.close()
+
+
+def unique_names(columns):
+    """Column names with repeats suffixed (_2, _3...), as Parquet needs distinct fields.
+
+    Suffixes already taken by another column, as in a, a, a_2, are skipped.
+    """
+    names, used, counts = [], set(columns), {}
+    for name in columns:
+        if name not in counts:
+            counts[name] = 1
+            names.append(name)
+            continue
+        n = counts[name] + 1
+        while f"{name}_{n}" in used:
+            n += 1
+        counts[name] = n
+        used.add(f"{name}_{n}")
+        names.append(f"{name}_{n}")
+    return names
+
+
+class ParquetFile:
+    """Parquet file of string columns fed with whole CSV records, one row group per ROW_GROUP_BYTES of CSV"""
+
+    def __init__(self, path, columns):
+        self.width = len(columns)
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in unique_names(columns)])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.pending = []
+        self.size = 0
+
+    def write(self, data):
+        self.pending.append(data)
+        self.size += len(data)
+        if self.size >= ROW_GROUP_BYTES:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        text = b''.join(self.pending).decode('utf-8')
+        self.pending = []
+        self.size = 0
+        values = [[] for _ in range(self.width)]
+        for row in csv.reader(io.StringIO(text, newline='')):
+            for i, column in enumerate(values):
+                column.append(row[i] if i < len(row) else '')
+        arrays = [pyarrow.array(column, type=pyarrow.string()) for column in values]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        try:
+            if self.pending:
+                self._write_row_group()
+        finally:
+            self.writer.close()
+
+
+class BackgroundWriter:
+    """Collects writes into large buffers and passes them to a sink on a separate thread"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.pending = []
+        self.size = 0
+        self.error = None
+        self.queue = queue.Queue(WRITER_QUEUE)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is None:
+                try:
+                    self.sink.write(data)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, data):
+        self.pending.append(data)
+        self.size += len(data)
+        if self.size >= BUFFER_SIZE:
+            self._hand_off()
+
+    def _hand_off(self):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(b''.join(self.pending))
+        self.pending = []
+        self.size = 0
+
+    def close(self):
+        if self.pending and self.error is None:
+            self._hand_off()
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+        if self.error is not None:
+            raise self.error
+
+
+def check_output_format(output_format):
+    """Raise MergeError when the package an output format needs is missing"""
+    if output_format == 'csv.zst' and zstandard is None:
+        raise MergeError("zstd output needs the zstandard package (pip install zstandard)")
+    if output_format == 'parquet' and pyarrow is None:
+        raise MergeError("Parquet output needs the pyarrow package (pip install pyarrow)")
+
+
+def open_output(path, output_format='csv', columns=None, buffering=BUFFER_SIZE):
+    """Binary writer for a merge output; columns name the Parquet fields"""
+    if output_format == 'csv':
+        return open(path, 'wb', buffering=buffering)
+    if output_format == 'parquet':
+        return BackgroundWriter(ParquetFile(path, columns or []))
+    return BackgroundWriter(CompressedFile(path, output_format))
+
+
+class RowOutput:
+    """Binary output of a parsing merge, through the deduplicator and sorter when they are on"""
+
+    def __init__(self, path, temp_parent, dedup=False, sort=False, output_format='csv', columns=None):
+        self.output_format = output_format
+        self.out = open_output(path, output_format, columns)
+        self.sorter = ExternalSorter(temp_parent) if sort else None
+        self.dedup = Deduplicator(temp_parent, keyed=sort) if dedup else None
+
+    def write_header(self, columns):
+        if columns is not None and self.output_format != 'parquet':
+            header_out = io.StringIO()
+            csv.writer(header_out).writerow(columns)
+            self.out.write(header_out.getvalue().encode('utf-8'))
+
+    def write(self, data, records):
+        """Write a block from RowTransform.encode"""
+        if records is None:
+            self.out.write(data)
+        elif self.dedup is not None:
+            self.dedup.write(records, self.emit)
+        else:
+            for _, key, line in records:
+                self.emit(key, line)
+
+    def emit(self, key, line):
+        if self.sorter is not None:
+            self.sorter.add(key, line)
+        else:
+            self.out.write(line)
+
+    def finish(self, report, should_stop):
+        """Flush rows held back for deduplication or sorting; False if stopped"""
+        if self.dedup is not None and not self.dedup.finish(self.emit, report, should_stop):
+            return False
+        if self.sorter is not None and not self.sorter.finish(self.out, report, should_stop):
+            return False
+        return True
+
+    def removed(self):
+        return None if self.dedup is None else self.dedup.removed
+
+    def close(self):
+        self.out.close()
+        for stage in (self.dedup, self.sorter):
+            if stage is not None:
+                stage.close()
+
+
+# -------------------- Raw Copy --------------------
+class RawInput:
+    """Header line of one input, read in binary, where its body starts and whether it ends inside a quote"""
+
+    def __init__(self, file_path):
+        self.path = file_path
+        self.size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            line = f.readline(MAX_HEADER_BYTES)
+            self.body_start = f.tell()
+            self.last_byte = b''
+            if self.size > self.body_start:
+                f.seek(-1, os.SEEK_END)
+                self.last_byte = f.read(1)
+        if line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        self.terminator = b'\r\n' if line.endswith(b'\r\n') else b'\n' if line.endswith(b'\n') else b''
+        self.header_line = line[:len(line) - len(self.terminator)]
+        self.header = None
+        text = self.header_line.decode('utf-8', errors='ignore')
+        if self.header_line and '\r' not in text and text.count('"') % 2 == 0:
+            self.header = next(csv.reader([text]), None)
+        self.open_quote = self.header is not None and ends_in_quote(file_path)
+
+    def unusable(self):
+        """Why this file needs parsing, or None"""
+        if self.size == 0:
+            return None
+        if self.header is None:
+            return "header is not a single plain line"
+        if not self.terminator and self.body_start < self.size:
+            return "header line too long"
+        return None
+
+
+def ends_in_quote(file_path):
+    """Whether a file has an odd number of quote bytes, so its last field is never closed"""
+    odd = False
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b''):
+            odd ^= chunk.count(b'"') % 2 == 1
+    return odd
+
+
+def parse_body(item, out, terminator, report, should_stop):
+    """Write an input's rows after the header through csv.writer, closing an open quote; False if stopped"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator=terminator.decode('ascii'))
+    with open(item.path, 'rb') as raw, io.TextIOWrapper(raw, encoding='utf-8-sig', errors='ignore',
+                                                        newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for block in iter(lambda: list(itertools.islice(reader, BLOCK_ROWS)), []):
+            if should_stop():
+                return False
+            writer.writerows(block)
+            out.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+            report(raw.tell() - item.body_start)
+    return True
+
+
+def plan_raw_copy(input_files):
+    """([RawInput], None) when the files can be concatenated as bytes, else (None, reason)"""
+    inputs = [RawInput(path) for path in input_files]
+    for item in inputs:
+        reason = item.unusable()
+        if reason:
+            return None, f"{os.path.basename(item.path)}: {reason}"
+    terminators = {item.terminator for item in inputs if item.terminator}
+    if len(terminators) > 1:
+        return None, "files use different line endings"
+    return inputs, None
+
+
+def copy_bytes(src, dst, offset, count, report, should_stop):
+    """Copy count bytes of src from offset to dst's position; False if stopped"""
+    kernel_copy = hasattr(os, 'copy_file_range') and hasattr(dst, 'fileno')
+    done = 0
+    while done < count:
+        if should_stop():
+            return False
+        size = min(COPY_CHUNK, count - done)
+        copied = 0
+        if kernel_copy:
+            try:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), size, offset + done)
+            except OSError:
+                kernel_copy = False
+        if not copied:
+            src.seek(offset + done)
+            remaining = size
+            while remaining:
+                chunk = src.read(min(BUFFER_SIZE, remaining))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                copied += len(chunk)
+                remaining -= len(chunk)
+            if not copied:
+                break
+        done += copied
+        report(done)
+    return True
+
+
+def raw_merge(inputs, out, include_headers, progress, should_stop, total_bytes):
+    """Concatenate planned inputs into out (an unbuffered file or a compressing writer); False if stopped"""
+    done_bytes = 0
+    wrote_header = False
+    terminator = next((item.terminator for item in inputs if item.terminator), b'\r\n')
+    for item in inputs:
+        name = os.path.basename(item.path)
+        if item.size and not wrote_header:
+            wrote_header = True
+            if include_headers:
+                out.write(item.header_line + terminator)
+        body = item.size - item.body_start
+        report = lambda copied: progress(done_bytes + item.body_start + copied, total_bytes, f"Copying {name}...")
+        if body > 0 and item.open_quote:
+            # Copied as is, the open quote would swallow the next file
+            if not parse_body(item, out, terminator, report, should_stop):
+                return False
+        elif body > 0:
+            with open(item.path, 'rb') as src:
+                if not copy_bytes(src, out, item.body_start, body, report, should_stop):
+                    return False
+            if item.last_byte not in (b'\n', b'\r'):
+                out.write(terminator)
+        done_bytes += item.size
+        progress(done_bytes, total_bytes, f"Merged {name}")
+    return True
+
+
+# -------------------- Parsing --------------------
+def parsed_merge(input_files, dialects, output, progress, should_stop, total_bytes, transform):
+    """Merge by parsing every row into a RowOutput.
+
+    Returns the number of data rows read, or None if stopped.
+    """
+    done_bytes = 0
+    rows = 0
+    for index, (file_path, dialect) in enumerate(zip(input_files, dialects)):
+        name = os.path.basename(file_path)
+        raw, f = open_csv(file_path, dialect)
+        with f:
+            reader = csv.reader(f, **dialect.options())
+            next(reader, None)
+
+            while True:
+                if should_stop():
+                    return None
+                block = list(itertools.islice(reader, BLOCK_ROWS))
+                if not block:
+                    break
+                if transform.active():
+                    block = transform(block, index)
+                output.write(*transform.encode(block))
+                rows += len(block)
+                progress(done_bytes + raw.tell(), total_bytes, f"Merging {name}...")
+        done_bytes += os.path.getsize(file_path)
+        progress(done_bytes, total_bytes, f"Merged {name}")
+    return rows
+
+
+def presorted_merge(input_files, dialects, output, progress, should_stop, total_bytes, transform):
+    """k-way merge of inputs that are each sorted already, straight to the output.
+
+    Returns the number of data rows, or None if stopped. Raises OutOfOrder
+    as soon as a file turns out not to be sorted.
+    """
+    def stream(index, f, dialect):
+        reader = csv.reader(f, **dialect.options())
+        next(reader, None)
+        previous = None
+        while True:
+            block = list(itertools.islice(reader, BLOCK_ROWS))
+            if not block:
+                return
+            for _, key, line in transform.encode(transform(block, index))[1]:
+                if previous is not None and key < previous:
+                    raise OutOfOrder()
+                previous = key
+                yield key, line
+
+    opened = []
+    try:
+        streams = []
+        for index, (file_path, dialect) in enumerate(zip(input_files, dialects)):
+            raw, f = open_csv(file_path, dialect)
+            opened.append((raw, f))
+            streams.append(stream(index, f, dialect))
+        rows = 0
+        for _, line in heapq.merge(*streams, key=itemgetter(0)):
+            output.out.write(line)
+            rows += 1
+            if rows % BLOCK_ROWS == 0:
+                if should_stop():
+                    return None
+                progress(sum(raw.tell() for raw, _ in opened), total_bytes, "Merging sorted files...")
+        return rows
+    finally:
+        for _, f in opened:
+            f.close()
+
+
+def split_records(f, chunk_bytes=CHUNK_BYTES, quote=b'"'):
+    """Yield pieces of a binary CSV file, each cut after a newline outside quotes"""
+    tail = b''
+    while True:
+        block = f.read(chunk_bytes)
+        if not block:
+            if tail:
+                yield tail
+            return
+        data = tail + block
+        cut = data.rfind(b'\n')
+        while cut >= 0 and data.count(quote, 0, cut) % 2:
+            cut = data.rfind(b'\n', 0, cut)
+        if cut < 0:
+            tail = data
+            continue
+        yield data[:cut + 1]
+        tail = data[cut + 1:]
+
+
+def parse_chunk(data, first, transform, file_index, dialect):
+    """(CSV bytes, row records, rows) for one chunk, see RowTransform.encode; run in a worker.
+
+    A file's first chunk loses its header.
+
+    A sentinel record is parsed after the chunk: if it does not come back
+    as a row of its own the chunk ended inside a quoted field, and
+    SplitError is raised. With a row filter only the records holding its
+    literal are parsed, as long as the chunk quotes its fields cleanly with
+    double quotes, so that counting quotes finds the same record
+    boundaries as csv.reader, and each record parses as one row. Otherwise
+    the whole chunk is parsed and checked as above.
+    """
+    text = data.decode(dialect.encoding, errors='ignore')
+    options = dialect.options()
+    if not text:
+        return b'', None, 0
+    if not text.endswith(('\n', '\r')):
+        text += '\n'
+    rows = None
+    if (transform.row_filter is not None and dialect.quotechar == '"'
+            and ('"' not in text or well_formed(dialect.delimiter).fullmatch(text))):
+        records = transform.row_filter.candidates(text, record_end(text, 0) if first else 0)
+        if records is not None:
+            rows = list(csv.reader(io.StringIO(''.join(records) + SENTINEL, newline=''), **options))
+            if len(rows) != len(records) + 1 or rows.pop() != [SENTINEL]:
+                rows = None
+    if rows is None:
+        rows = list(csv.reader(io.StringIO(text + SENTINEL, newline=''), **options))
+        if not rows or rows.pop() != [SENTINEL]:
+            raise SplitError()
+        if first and rows:
+            rows.pop(0)
+    if transform.active():
+        rows = transform(rows, file_index)
+    return (*transform.encode(rows), len(rows))
+
+
+class InlineExecutor:
+    """Runs submitted calls straight away in the calling thread"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def parallel_merge(input_files, dialects, output, progress, should_stop, total_bytes, transform, processes):
+    """parsed_merge with parsing in worker processes, or chunk by chunk in this thread if processes is 0.
+
+    Raises SplitError when a file cannot be cut into chunks safely.
+    """
+    window = max(2, min(2 * processes, MAX_BUFFERED // CHUNK_BYTES))
+    if processes > 0:
+        executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        executor = InlineExecutor()
+    pending = collections.deque()
+    state = {'rows': 0, 'done': 0}
+
+    def write_next():
+        name, future, size = pending.popleft()
+        data, records, rows = future.result()
+        output.write(data, records)
+        state['rows'] += rows
+        state['done'] += size
+        progress(state['done'], total_bytes, f"Merging {name}...")
+
+    try:
+        for index, (file_path, dialect) in enumerate(zip(input_files, dialects)):
+            name = os.path.basename(file_path)
+            with open(file_path, 'rb', buffering=0) as f:
+                for i, chunk in enumerate(split_records(f, quote=dialect.quotechar.encode('ascii'))):
+                    if should_stop():
+                        return None
+                    future = executor.submit(parse_chunk, chunk, i == 0, transform, index, dialect)
+                    pending.append((name, future, len(chunk)))
+                    while len(pending) >= window:
+                        write_next()
+        while pending:
+            if should_stop():
+                return None
+            write_next()
+        return state['rows']
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# -------------------- Merge --------------------
+def merge_csv(input_files, output_file, include_headers=True, progress=None, should_stop=None, processes=0,
+              schema='same', dedup=False, dedup_keys=None, sort_column=None, sort_type='text', output_format='csv',
+              row_query=None):
+    """Merge CSV files into output_file.
+
+    progress(done_bytes, total_bytes, message) is called between blocks.
+    processes > 0 parses merges of at least PARALLEL_MIN_BYTES in that many
+    worker processes. schema is one of SCHEMA_MODES, see SchemaPlan. dedup
+    drops repeated rows, or rows repeating the dedup_keys column names.
+    sort_column orders the output by that column, compared as one of
+    SORT_TYPES (stable, so equal keys keep their input order). output_format
+    is one of OUTPUT_FORMATS. row_query keeps only matching rows: a dict
+    with search_string, case_sensitive, whole_word, use_regex and columns
+    (names to search, empty for all). Each input's encoding and dialect
+    are detected first (see detect_dialects) and reported through progress;
+    the output is UTF-8 with commas.
+    Returns a MergeSummary, or None if stopped. Raises MergeError when the
+    headers do not fit the schema mode or the query is invalid, before any
+    rows are read.
+    """
+    progress = progress or (lambda done, total, message: None)
+    should_stop = should_stop or (lambda: False)
+    check_output_format(output_format)
+    total_bytes = sum(os.path.getsize(path) for path in input_files)
+    summary = MergeSummary(len(input_files))
+    temp_file = output_file + '.part'
+    temp_parent = os.path.dirname(os.path.abspath(output_file))
+
+    dialects = detect_dialects(input_files)
+    if not all(dialect.plain() and dialect.detected for dialect in dialects):
+        detected = dialect_notes(input_files, dialects)
+        progress(0, total_bytes, f"Detected formats: {'; '.join(detected)}")
+        summary.notes.append(f"Read as {'; '.join(detected)}")
+    plan = SchemaPlan(input_files, schema, dialects)
+    summary.notes.extend(plan.notes)
+    if plan.notes:
+        progress(0, total_bytes, f"Aligning columns: {'; '.join(plan.notes)}")
+    columns = plan.columns if include_headers else None
+    sort = None
+    if sort_column is not None:
+        sort = (column_index(plan.columns, sort_column, "Sort column"), sort_type)
+    row_filter = None
+    if row_query and row_query['search_string']:
+        query_columns = row_query.get('columns') or []
+        indexes = [column_index(plan.columns, name, "Filter column") for name in query_columns]
+        try:
+            row_filter = RowFilter(row_query['search_string'], row_query.get('case_sensitive', False),
+                                   row_query.get('whole_word', False), row_query.get('use_regex', False),
+                                   indexes or None)
+        except re.error as e:
+            raise MergeError(f"Invalid filter pattern: {e}")
+    transform = RowTransform(plan.vectors, dedup_columns(plan.columns, dedup_keys or []) if dedup else None, sort,
+                             row_filter)
+
+    def parse(merge, *args):
+        """Run a parsing merge into the temporary file; rows written, or None if stopped"""
+        output = RowOutput(temp_file, temp_parent, dedup, sort is not None, output_format, plan.columns)
+        try:
+            output.write_header(columns)
+            rows = merge(input_files, dialects, output, progress, should_stop, total_bytes, transform, *args)
+            if rows is None:
+                return None
+            if not output.finish(lambda message: progress(total_bytes, total_bytes, message), should_stop):
+                return None
+            removed = output.removed()
+            if removed is not None:
+                summary.removed = removed
+                rows -= removed
+            return rows
+        finally:
+            output.close()
+
+    try:
+        if not all(dialect.plain() for dialect in dialects):
+            inputs, reason = None, "some files are not UTF-8 with commas"
+        elif plan.vectors:
+            inputs, reason = None, "columns are rearranged"
+        elif dedup:
+            inputs, reason = None, "duplicates are removed"
+        elif sort is not None:
+            inputs, reason = None, "rows are sorted"
+        elif row_filter is not None:
+            inputs, reason = None, "rows are filtered"
+        elif output_format == 'parquet':
+            inputs, reason = None, "Parquet needs parsed rows"
+        else:
+            inputs, reason = plan_raw_copy(input_files)
+        if inputs is not None:
+            out = open_output(temp_file, output_format, buffering=0)
+            try:
+                if not raw_merge(inputs, out, include_headers, progress, should_stop, total_bytes):
+                    return None
+            finally:
+                out.close()
+            summary.copied = True
+        else:
+            logging.info(f"CSV merge parses rows: {reason}")
+            merged = presorted = False
+            if sort is not None and not dedup:
+                try:
+                    summary.rows = parse(presorted_merge)
+                    merged = presorted = True
+                except OutOfOrder:
+                    logging.info("CSV merge inputs are not sorted yet, sorting in runs")
+            workers = processes if total_bytes >= PARALLEL_MIN_BYTES else 0
+            splittable = all(dialect.splittable() for dialect in dialects)
+            if not merged and splittable and (workers > 0 or row_filter is not None):
+                try:
+                    summary.rows = parse(parallel_merge, workers)
+                    merged = True
+                except SplitError:
+                    logging.info("CSV merge could not split the files on record boundaries, parsing in one thread")
+            if not merged:
+                summary.rows = parse(parsed_merge)
+            if summary.rows is None:
+                return None
+            if row_filter is not None:
+                where = f" in {', '.join(query_columns)}" if query_columns else ""
+                summary.notes.append(f"Kept rows matching {row_query['search_string']!r}{where}")
+            if sort is not None:
+                summary.notes.append(f"Sorted by {sort_column}" + (" (the files were already sorted)" if presorted else ""))
+        os.replace(temp_file, output_file)
+        return summary
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
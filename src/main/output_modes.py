@@ -0,0 +1,61 @@
+import os
+import errno
+import shutil
+
+# How matching files are placed in the output folder. Nothing in here
+# depends on Qt.
+OUTPUT_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, XFS, ...)
+
+
+def reflink_file(src, dest):
+    import fcntl
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except Exception:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    shutil.copystat(src, dest)
+
+
+def same_path(src, dest):
+    """True if src and dest name the same directory entry, not just the same file"""
+    src_dir, dest_dir = os.path.dirname(os.path.abspath(src)), os.path.dirname(os.path.abspath(dest))
+    try:
+        same_dir = os.path.samefile(src_dir, dest_dir)
+    except OSError:
+        return False
+    return same_dir and os.path.normcase(os.path.basename(src)) == os.path.normcase(os.path.basename(dest))
+
+
+def materialize_file(src, dest, mode='copy'):
+    """Place src at dest using the given output mode.
+
+    Whatever is at dest is unlinked first, so a link left by an earlier
+    run is replaced rather than written through to the file it points at.
+    Links and clones that the filesystem refuses (different devices, no
+    reflink support, no symlink privilege) fall back to a full copy.
+    Returns the mode that was actually used.
+    """
+    if same_path(src, dest):
+        return mode
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if mode != 'copy':
+        try:
+            if mode == 'hardlink':
+                os.link(src, dest)
+            elif mode == 'reflink':
+                reflink_file(src, dest)
+            elif mode == 'symlink':
+                os.symlink(os.path.abspath(src), dest)
+            return mode
+        except (OSError, ImportError, NotImplementedError, AttributeError) as e:
+            if isinstance(e, OSError) and e.errno not in (
+                    errno.EXDEV, errno.EPERM, errno.EACCES, errno.ENOTSUP,
+                    errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.EMLINK, None):
+                raise
+    shutil.copy2(src, dest)
+    return 'copy'
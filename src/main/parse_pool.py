@@ -0,0 +1,73 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from search_engine import search_file
+from bloom_filter import SummaryBuilder
+from query_language import BooleanQuery
+from ranking import DocumentStats
+
+# CPU stage for the search. Parsing PDFs, Word documents and workbooks is
+# pure-Python work that holds the GIL, so it is handed to worker processes.
+# The process pool is created at full size on first use; `slots` is the
+# number of files allowed in flight, which is what the autotuner adjusts.
+# Closing the pool sets an event shared with the workers, which files being
+# parsed check through their FileBudget, so Stop does not wait for them.
+
+PARSE_POOL_TYPES = ('.pdf', '.docx', '.xlsx')
+MAX_PROCESSES = os.cpu_count() or 1
+
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _search_file(file_path, extension, pattern, flags, data, max_seconds, max_bytes, summarize, rank):
+    """search_file plus the file's Bloom summary (None unless complete) and ranking stats"""
+    summary = SummaryBuilder() if summarize else None
+    stats = DocumentStats() if rank else None
+    result = search_file(file_path, extension, pattern, flags, data, max_seconds, max_bytes, summary, stats,
+                         _stop_event.is_set if _stop_event is not None else None)
+    return (*result, summary.build() if summary and summary.complete else None, stats)
+
+
+class ParsePool:
+    def __init__(self, slots=1, max_processes=MAX_PROCESSES):
+        self.max_processes = max_processes
+        self.slots = max(0, min(slots, max_processes))
+        self.executor = None
+        self.stop_event = None
+        self.started = {}
+        self.busy_time = 0.0
+
+    def set_slots(self, slots):
+        self.slots = max(1, min(slots, self.max_processes))
+
+    def submit(self, file_path, extension, regex, data=None, max_seconds=0, max_bytes=0, summarize=False,
+               rank=False):
+        if self.executor is None:
+            context = multiprocessing.get_context('spawn')
+            self.stop_event = context.Event()
+            self.executor = ProcessPoolExecutor(self.max_processes, mp_context=context,
+                                                initializer=_init_worker, initargs=(self.stop_event,))
+        pattern = regex if isinstance(regex, BooleanQuery) else regex.pattern
+        future = self.executor.submit(_search_file, file_path, extension, pattern, regex.flags,
+                                      data, max_seconds, max_bytes, summarize, rank)
+        self.started[future] = time.monotonic()
+        return future
+
+    def finished(self, future):
+        """(occurrences, locations, status, summary, stats) of a submitted file"""
+        self.busy_time += time.monotonic() - self.started.pop(future, time.monotonic())
+        return future.result()
+
+    def close(self):
+        """Cancel queued files and abort the ones being parsed"""
+        if self.executor is not None:
+            self.stop_event.set()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Read-ahead stage for the search. On network shares most of the time per
+# file is spent waiting on open() and read(), so a small thread pool keeps
+# several reads in flight while the matching loop works on files that are
+# already in memory. Buffered bytes are capped; files too big to buffer are
+# left for the extractor to stream from disk as before.
+
+DEFAULT_DEPTH = 8
+MAX_DEPTH = 64
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+class Prefetcher:
+    def __init__(self, paths, depth=DEFAULT_DEPTH, max_bytes=DEFAULT_MAX_BYTES):
+        self.pending = deque(paths)
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_bytes // 4
+        self.in_flight = {}
+        self.taken_early = set()
+        self.buffered = 0
+        self.wait_time = 0.0
+        self.takes = self.ready_takes = 0
+        self.pool = ThreadPoolExecutor(max_workers=MAX_DEPTH, thread_name_prefix='prefetch')
+        self._fill()
+
+    def set_depth(self, depth):
+        self.depth = max(1, min(MAX_DEPTH, depth))
+        self._fill()
+
+    def _fill(self):
+        while self.pending and len(self.in_flight) < self.depth:
+            path = self.pending[0]
+            if path in self.taken_early:
+                self.pending.popleft()
+                self.taken_early.discard(path)
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if size > self.max_file_bytes:
+                self.pending.popleft()
+                self.in_flight[path] = None
+                continue
+            if self.in_flight and self.buffered + size > self.max_bytes:
+                break
+            self.pending.popleft()
+            self.buffered += size
+            self.in_flight[path] = (self.pool.submit(read_file, path), size)
+
+    def take(self, path):
+        """Content of path, or None if the caller should read it from disk itself.
+
+        Paths may be taken out of order; one that was not read yet is
+        dropped from the read-ahead queue.
+        """
+        data = None
+        if path not in self.in_flight:
+            self.taken_early.add(path)
+        entry = self.in_flight.pop(path, None)
+        if entry is not None:
+            future, size = entry
+            self.takes += 1
+            self.ready_takes += future.done()
+            waited = time.monotonic()
+            try:
+                data = future.result()
+            except OSError as e:
+                logging.error(f"Prefetch failed for {path}: {e}")
+            self.wait_time += time.monotonic() - waited
+            self.buffered -= size
+        self._fill()
+        return data
+
+    def close(self):
+        self.pending.clear()
+        self.taken_early.clear()
+        for entry in self.in_flight.values():
+            if entry is not None:
+                entry[0].cancel()
+        self.in_flight.clear()
+        self.pool.shutdown(wait=False)
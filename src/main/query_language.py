@@ -0,0 +1,266 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# Boolean and proximity queries, e.g.
+#
+#   invoice AND overdue NOT paid
+#   "termination clause" OR cancellation
+#   contract NEAR/5 termination
+#
+# Operators are upper case: AND (also implied between terms), OR, NOT and
+# NEAR/n (terms at most n words apart; plain NEAR means NEAR/10). Quotes
+# make a phrase, parentheses group. Terms and phrases follow the case and
+# whole-word options of the search box.
+#
+# A parsed query is a tree of tuples like the trigram queries:
+#   ('term', i)  ('and', (...))  ('or', (...))  ('not', sub)  ('near', n, i, j)
+# where i and j index BooleanQuery.terms. Each file gets a FileMatcher that
+# is fed the file's text units in order and stops the scan as soon as the
+# file can no longer match.
+
+DEFAULT_NEAR = 10
+WORD_RE = re.compile(r'\w+')
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"?|([^\s()"]+))')
+NEAR_RE = re.compile(r'NEAR(?:/(\d+))?$')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class BooleanQuery:
+    engine = 'boolean query'
+
+    def __init__(self, text, case_sensitive=False, whole_word=False):
+        self.pattern = text
+        self.flags = 0 if case_sensitive else re.IGNORECASE
+        self.whole_word = whole_word
+        self.terms = []
+        self.tokens = self._tokenize(text)
+        self.tree = self._parse_or()
+        if self.tokens:
+            raise QuerySyntaxError(f"Unexpected {self.tokens[0][1]!r}")
+        self.positive = set()
+        self._mark(self.tree, True)
+        if not self.positive:
+            raise QuerySyntaxError("The query needs at least one term that is not negated")
+        self.near_terms = {i for node in self._nodes(self.tree) if node[0] == 'near' for i in node[2:]}
+
+    # -------------------- Parsing --------------------
+    @staticmethod
+    def _tokenize(text):
+        tokens, pos = [], 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = TOKEN_RE.match(text, pos)
+            pos = m.end()
+            if m.group(1):
+                tokens.append(('(', '('))
+            elif m.group(2):
+                tokens.append((')', ')'))
+            elif m.group(3) is not None:
+                tokens.append(('phrase', m.group(3)))
+            elif m.group(4) in ('AND', 'OR', 'NOT'):
+                tokens.append((m.group(4), m.group(4)))
+            elif NEAR_RE.match(m.group(4)):
+                tokens.append(('NEAR', int(NEAR_RE.match(m.group(4)).group(1) or DEFAULT_NEAR)))
+            else:
+                tokens.append(('word', m.group(4)))
+        if not tokens:
+            raise QuerySyntaxError("Empty query")
+        return tokens
+
+    def _peek(self):
+        return self.tokens[0][0] if self.tokens else None
+
+    def _parse_or(self):
+        args = [self._parse_and()]
+        while self._peek() == 'OR':
+            self.tokens.pop(0)
+            args.append(self._parse_and())
+        return args[0] if len(args) == 1 else ('or', tuple(args))
+
+    def _parse_and(self):
+        args = [self._parse_not()]
+        while self._peek() in ('AND', 'NOT', 'word', 'phrase', '('):
+            if self._peek() == 'AND':
+                self.tokens.pop(0)
+            args.append(self._parse_not())
+        return args[0] if len(args) == 1 else ('and', tuple(args))
+
+    def _parse_not(self):
+        if self._peek() == 'NOT':
+            self.tokens.pop(0)
+            return ('not', self._parse_not())
+        return self._parse_near()
+
+    def _parse_near(self):
+        node = self._parse_primary()
+        while self._peek() == 'NEAR':
+            distance = self.tokens.pop(0)[1]
+            right = self._parse_primary()
+            if node[0] != 'term' or right[0] != 'term':
+                raise QuerySyntaxError("NEAR only joins single terms or phrases")
+            node = ('near', distance, node[1], right[1])
+        return node
+
+    def _parse_primary(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Query ends too early")
+        kind, value = self.tokens.pop(0)
+        if kind == '(':
+            node = self._parse_or()
+            if self._peek() != ')':
+                raise QuerySyntaxError("Missing ')'")
+            self.tokens.pop(0)
+            return node
+        if kind in ('word', 'phrase'):
+            return ('term', self._add_term(value))
+        raise QuerySyntaxError(f"Unexpected {value!r}")
+
+    def _add_term(self, text):
+        words = text.split()
+        if not words:
+            raise QuerySyntaxError("Empty phrase")
+        pattern = r'\s+'.join(re.escape(word) for word in words)
+        if self.whole_word:
+            pattern = r'\b' + pattern + r'\b'
+        self.terms.append((text, re.compile(pattern, self.flags)))
+        return len(self.terms) - 1
+
+    def _mark(self, node, positive):
+        if node[0] == 'term':
+            if positive:
+                self.positive.add(node[1])
+        elif node[0] == 'near':
+            if positive:
+                self.positive.update(node[2:])
+        elif node[0] == 'not':
+            self._mark(node[1], not positive)
+        else:
+            for sub in node[1]:
+                self._mark(sub, positive)
+
+    def _nodes(self, node):
+        yield node
+        if node[0] in ('and', 'or'):
+            for sub in node[1]:
+                yield from self._nodes(sub)
+        elif node[0] == 'not':
+            yield from self._nodes(node[1])
+
+    def start_file(self):
+        return FileMatcher(self)
+
+
+class TermMatch:
+    """Match-like record of one term hit, for format_location"""
+    __slots__ = ('_start', '_end', 'term')
+
+    def __init__(self, start, end, term):
+        self._start, self._end, self.term = start, end, term
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+
+class FileMatcher:
+    """Evaluates a BooleanQuery over one file's text units in a single pass"""
+
+    def __init__(self, query):
+        self.query = query
+        self.found = [False] * len(query.terms)
+        self.positions = {i: [] for i in query.near_terms}
+        self.near_done = set()
+        self.words_seen = 0
+        self.rejected = False
+
+    def feed(self, text):
+        """Term hits in one text unit; sets rejected once no match is possible"""
+        hits = []
+        new_positions = {}
+        word_starts = None
+        if self.query.near_terms:
+            word_starts = [m.start() for m in WORD_RE.finditer(text)]
+        for i, (_, regex) in enumerate(self.query.terms):
+            if self.found[i] and i not in self.query.positive and i not in self.positions:
+                continue
+            for match in regex.finditer(text):
+                self.found[i] = True
+                if i in self.query.positive:
+                    hits.append(TermMatch(match.start(), match.end(), i))
+                if i in self.positions:
+                    position = self.words_seen + max(bisect_right(word_starts, match.start()) - 1, 0)
+                    self.positions[i].append(position)
+                    new_positions.setdefault(i, []).append(position)
+                elif i not in self.query.positive:
+                    break
+        if word_starts is not None:
+            self.words_seen += len(word_starts)
+        if new_positions:
+            self._update_near(self.query.tree, new_positions)
+        if self._evaluate(self.query.tree, final=False) is False:
+            self.rejected = True
+        hits.sort(key=lambda hit: hit.start())
+        return hits
+
+    def accepted(self):
+        """Whether the whole file matched, once every unit has been fed"""
+        return not self.rejected and self._evaluate(self.query.tree, final=True)
+
+    def _update_near(self, node, new_positions):
+        for sub in self.query._nodes(node):
+            if sub[0] != 'near' or sub in self.near_done:
+                continue
+            distance, a, b = sub[1:]
+            for x, y in ((a, b), (b, a)):
+                others = self.positions[y]
+                for position in new_positions.get(x, ()):
+                    i = bisect_left(others, position - distance)
+                    if i < len(others) and others[i] <= position + distance:
+                        self.near_done.add(sub)
+                        break
+                if sub in self.near_done:
+                    break
+
+    def _evaluate(self, node, final):
+        """True, False or None (not decided until more text is seen)"""
+        op = node[0]
+        if op == 'term':
+            return True if self.found[node[1]] else (False if final else None)
+        if op == 'near':
+            return True if node in self.near_done else (False if final else None)
+        if op == 'not':
+            value = self._evaluate(node[1], final)
+            return None if value is None else not value
+        values = [self._evaluate(sub, final) for sub in node[1]]
+        if op == 'and':
+            if False in values:
+                return False
+            return True if all(values) else None
+        if True in values:
+            return True
+        return False if all(v is False for v in values) else None
+
+
+class RegexMatcher:
+    """FileMatcher counterpart for a plain regex: every match counts"""
+    rejected = False
+
+    def __init__(self, regex):
+        self.regex = regex
+
+    def feed(self, text):
+        return self.regex.finditer(text)
+
+    def accepted(self):
+        return True
+
+
+def file_matcher(regex):
+    if isinstance(regex, BooleanQuery):
+        return regex.start_file()
+    return RegexMatcher(regex)
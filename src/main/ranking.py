@@ -0,0 +1,101 @@
+import math
+import heapq
+import itertools
+
+# BM25 relevance ranking. Every searched file contributes its length in
+# words and the number of hits per query term (one term for a plain search,
+# the non-negated terms of a boolean query). Only the best top_k matches
+# are kept, in a min-heap, so memory does not grow with the match count.
+#
+# Corpus statistics (number of documents, average length, document
+# frequency per term) come from the trigram index when one is present; the
+# frequencies are then trigram-candidate counts, an upper bound. Without an
+# index they are gathered from the files searched so far: nothing is
+# dropped until WARMUP_DOCUMENTS files have been seen, and the heap is
+# rescored whenever the counts have grown by a tenth and once more at the
+# end, so scores from noisy early statistics do not crowd out later files.
+
+K1 = 1.2
+B = 0.75
+DEFAULT_TOP_K = 100
+WARMUP_DOCUMENTS = 1000
+
+
+class DocumentStats:
+    """Length and per-term hit counts of one file, filled in during the scan"""
+
+    def __init__(self):
+        self.length = 0
+        self.term_freqs = {}
+
+    def add_text(self, text):
+        self.length += len(text.split())
+
+    def hit(self, match):
+        term = getattr(match, 'term', 0)
+        self.term_freqs[term] = self.term_freqs.get(term, 0) + 1
+
+
+class BM25Ranker:
+    def __init__(self, term_count, top_k=DEFAULT_TOP_K, corpus=None):
+        """corpus: (documents, average_length, {term: document_frequency}) from an index"""
+        self.term_count = term_count
+        self.top_k = top_k
+        self.corpus = corpus
+        self.documents = 0
+        self.total_length = 0
+        self.doc_freqs = [0] * term_count
+        self.heap = []
+        self.order = itertools.count()
+        self.rescored_at = 0
+
+    def observe(self, stats):
+        """Count a searched file towards the corpus statistics"""
+        self.documents += 1
+        self.total_length += stats.length
+        for term in stats.term_freqs:
+            self.doc_freqs[term] += 1
+
+    def _statistics(self):
+        documents = max(self.documents, 1)
+        average_length = self.total_length / documents or 1
+        doc_freqs = list(self.doc_freqs)
+        if self.corpus:
+            documents, average_length, indexed = self.corpus
+            for term, freq in indexed.items():
+                doc_freqs[term] = max(freq, doc_freqs[term])
+            documents = max(documents, self.documents)
+        return documents, average_length, doc_freqs
+
+    def score(self, stats, statistics=None):
+        documents, average_length, doc_freqs = statistics or self._statistics()
+        norm = K1 * (1 - B + B * stats.length / average_length)
+        total = 0.0
+        for term, freq in stats.term_freqs.items():
+            df = min(doc_freqs[term], documents)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            total += idf * freq * (K1 + 1) / (freq + norm)
+        return total
+
+    def add(self, item, stats):
+        """Offer a matching file; item is whatever the caller wants back"""
+        if not self.corpus and self.documents > self.rescored_at * 1.1:
+            statistics = self._statistics()
+            self.heap = [(self.score(s, statistics), order, i, s) for _, order, i, s in self.heap]
+            heapq.heapify(self.heap)
+            self.rescored_at = self.documents
+        entry = (self.score(stats), next(self.order), item, stats)
+        if len(self.heap) < self.top_k or (not self.corpus and self.documents < WARMUP_DOCUMENTS):
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+        while len(self.heap) > self.top_k and (self.corpus or self.documents >= WARMUP_DOCUMENTS):
+            heapq.heappop(self.heap)
+
+    def results(self):
+        """[(score, item)] best first, rescored with the final statistics"""
+        statistics = self._statistics()
+        scored = [(self.score(stats, statistics), order, item) for _, order, item, stats in self.heap]
+        scored.sort(key=lambda entry: (-entry[0], entry[1]))
+        del scored[self.top_k:]
+        return [(score, item) for score, _, item in scored]
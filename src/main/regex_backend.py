@@ -0,0 +1,313 @@
+import re
+import time
+import logging
+import threading
+import contextlib
+import multiprocessing
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Regex engines for user-supplied patterns. Python's re backtracks, so a
+# pattern like (a+)+$ can take exponential time on a long line and there is
+# no way to interrupt it from another thread. Patterns are classified when
+# they are compiled:
+#
+#   literal / safe  -> plain re, which is the fastest choice for them
+#   risky           -> RE2 (linear time) when the re2 module is installed
+#                      and supports the pattern, otherwise re running in a
+#                      helper process that is killed when a match takes
+#                      longer than MATCH_TIMEOUT seconds
+#
+# Risky means nested repeats, repeated alternation, backreferences, or two
+# unbounded repeats in a row that can match the same characters with
+# nothing in between to tell them apart, as in .*a.*b (polynomial, but
+# already hopeless on long lines). While a guarded match runs, the check
+# set with match_check is polled, so Stop still takes effect.
+
+MATCH_TIMEOUT = 2.0
+POLL_SECONDS = 0.1
+PROBE_CHARS = [chr(c) for c in range(128)] + ['\xa0', '\xe9', '\xdf', '\u0394', '\u4e2d', '\u2028']
+CATEGORY_PATTERNS = {
+    sre_parse.CATEGORY_DIGIT: r'\d', sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s', sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w', sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) + (
+    (sre_parse.POSSESSIVE_REPEAT,) if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else ())
+
+
+class RegexTimeout(Exception):
+    """A single match ran longer than the per-match time budget"""
+    reason = 'regex timed out'
+
+
+class SpanMatch:
+    """Minimal stand-in for re.Match built from a (start, end) span"""
+
+    def __init__(self, string, start, end):
+        self.string = string
+        self._span = (start, end)
+
+    def start(self):
+        return self._span[0]
+
+    def end(self):
+        return self._span[1]
+
+    def span(self):
+        return self._span
+
+    def group(self, index=0):
+        return self.string[self._span[0]:self._span[1]]
+
+
+# -------------------- Classification --------------------
+def _char_set(item, flags):
+    """Probe characters a one-character item can match, or None for anything more complex"""
+    if len(item) != 1:
+        return None
+    op, av = item[0]
+    if op == sre_parse.ANY:
+        return {c for c in PROBE_CHARS if c != '\n' or flags & re.DOTALL}
+    if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL):
+        chars = {chr(av)}
+        if flags & re.IGNORECASE:
+            chars |= {chr(av).lower(), chr(av).upper()}
+        return chars if op == sre_parse.LITERAL else set(PROBE_CHARS) - chars
+    if op != sre_parse.IN:
+        return None
+    chars, negate = set(), False
+    for set_op, set_av in av:
+        if set_op == sre_parse.NEGATE:
+            negate = True
+        elif set_op == sre_parse.LITERAL:
+            chars.add(chr(set_av))
+        elif set_op == sre_parse.RANGE:
+            chars |= {c for c in PROBE_CHARS if set_av[0] <= ord(c) <= set_av[1]}
+        elif set_op == sre_parse.CATEGORY and set_av in CATEGORY_PATTERNS:
+            chars |= {c for c in PROBE_CHARS if re.match(CATEGORY_PATTERNS[set_av], c)}
+        else:
+            return None
+    if flags & re.IGNORECASE:
+        chars |= {c.lower() for c in chars} | {c.upper() for c in chars}
+    return set(PROBE_CHARS) - chars if negate else chars
+
+
+def _unbounded(op, av):
+    return op in REPEATS and av[1] == sre_parse.MAXREPEAT
+
+
+def _overlapping_repeats(subpattern, flags):
+    """True if two unbounded repeats of the sequence can trade characters back and forth.
+
+    That is when the second can match something the first can, and the
+    first can also match everything between them (or all of it is
+    optional). Items that are not single characters count as matching
+    anything.
+    """
+    items = list(subpattern)
+    for i, (op, av) in enumerate(items):
+        if not _unbounded(op, av):
+            continue
+        first = _char_set(av[2], flags)
+        for later_op, later_av in items[i + 1:]:
+            if _unbounded(later_op, later_av):
+                second = _char_set(later_av[2], flags)
+                if first is None or second is None or first & second:
+                    return True
+            if later_op == sre_parse.AT or (later_op in REPEATS and later_av[0] == 0):
+                continue
+            between = _char_set(later_av[2] if later_op in REPEATS else [(later_op, later_av)], flags)
+            if first is not None and between is not None and not between <= first:
+                break
+    return False
+
+
+def _walk(subpattern, inside_repeat, findings, flags=0):
+    if _overlapping_repeats(subpattern, flags):
+        findings.add('overlapping repeats')
+    for op, av in subpattern:
+        if op == sre_parse.LITERAL:
+            continue
+        findings.add('special')
+        if op in REPEATS:
+            low, high, item = av
+            unbounded = high == sre_parse.MAXREPEAT or high > 1
+            if unbounded and inside_repeat:
+                findings.add('nested repeat')
+            _walk(item, inside_repeat or unbounded, findings, flags)
+        elif op == sre_parse.BRANCH:
+            if inside_repeat:
+                findings.add('repeated alternation')
+            for branch in av[1]:
+                _walk(branch, inside_repeat, findings, flags)
+        elif op == sre_parse.SUBPATTERN:
+            _walk(av[-1], inside_repeat, findings, flags)
+        elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+            _walk(av, inside_repeat, findings, flags)
+        elif op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            findings.add('backreference')
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            findings.add('lookaround')
+            _walk(av[1], inside_repeat, findings, flags)
+
+
+def classify_pattern(pattern, flags=0):
+    """Return (kind, findings): kind is 'literal', 'safe' or 'risky'"""
+    findings = set()
+    parsed = sre_parse.parse(pattern, flags)
+    _walk(parsed, False, findings, parsed.state.flags)
+    if findings & {'nested repeat', 'repeated alternation', 'backreference', 'overlapping repeats'}:
+        return 'risky', findings
+    return ('safe' if findings else 'literal'), findings
+
+
+def required_literal(pattern, flags=0):
+    """(text, ignore_case): the longest run of literal characters every match contains ('' if none)"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return '', False
+    best = current = ''
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            current += chr(av)
+            if len(current) > len(best):
+                best = current
+        else:
+            current = ''
+    return best, bool(parsed.state.flags & re.IGNORECASE)
+
+
+# -------------------- Engines --------------------
+class Re2Regex:
+    engine = 're2'
+
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.flags = flags
+        inline = ''.join(c for flag, c in ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'))
+                         if flags & flag)
+        self.compiled = re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+
+    def finditer(self, text):
+        return self.compiled.finditer(text)
+
+    def search(self, text):
+        return self.compiled.search(text)
+
+    def close(self):
+        pass
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def match_check(check):
+    """Have guarded matches in this thread call check() while they wait; it may raise to give up"""
+    previous = getattr(_local, 'check', None)
+    _local.check = check
+    try:
+        yield
+    finally:
+        _local.check = previous
+
+
+def _match_worker(conn, pattern, flags):
+    regex = re.compile(pattern, flags)
+    while True:
+        text = conn.recv()
+        if text is None:
+            break
+        conn.send([m.span() for m in regex.finditer(text)])
+
+
+class GuardedRegex:
+    """re running in a helper process, restarted when a match overruns"""
+    engine = 're (guarded)'
+
+    def __init__(self, pattern, flags, timeout=MATCH_TIMEOUT):
+        self.pattern = pattern
+        self.flags = flags
+        self.timeout = timeout
+        self.process = None
+        self.conn = None
+
+    def _start(self):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_match_worker, args=(child_conn, self.pattern, self.flags),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def finditer(self, text):
+        if self.process is None:
+            self._start()
+        self.conn.send(text)
+        check = getattr(_local, 'check', None)
+        deadline = time.monotonic() + self.timeout
+        while not self.conn.poll(POLL_SECONDS):
+            if check:
+                try:
+                    check()
+                except Exception:
+                    self.close(kill=True)
+                    raise
+            if time.monotonic() >= deadline:
+                logging.error(f"Regex {self.pattern!r} exceeded {self.timeout}s on a {len(text)} character text")
+                self.close(kill=True)
+                raise RegexTimeout(self.pattern)
+        return iter([SpanMatch(text, start, end) for start, end in self.conn.recv()])
+
+    def search(self, text):
+        return next(self.finditer(text), None)
+
+    def close(self, kill=False):
+        if self.process is None:
+            return
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+            self.process.join(1)
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+        self.process = self.conn = None
+
+    def __del__(self):
+        self.close(kill=True)
+
+
+def compile_regex(pattern, flags=0):
+    """Compile with the fastest engine that is safe for the pattern.
+
+    Raises re.error for invalid patterns. Safe patterns get a plain
+    re.Pattern; risky ones get an object with the same finditer/search
+    interface plus engine and close().
+    """
+    compiled = re.compile(pattern, flags)
+    kind, findings = classify_pattern(pattern, flags)
+    if kind != 'risky':
+        return compiled
+    if re2 is not None and not findings & {'backreference', 'lookaround'}:
+        try:
+            return Re2Regex(pattern, flags)
+        except Exception as e:
+            logging.error(f"RE2 rejected {pattern!r}, using guarded re: {e}")
+    return GuardedRegex(pattern, flags)
+
+
+def engine_name(regex):
+    return getattr(regex, 'engine', 're')
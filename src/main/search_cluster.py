@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import queue
+import socket
+import argparse
+import threading
+import subprocess
+
+from search_daemon import daemon_available, daemon_search, READ_TIMEOUT
+
+# Coordinator for searching an archive that is spread over several file
+# servers. Every server runs a search daemon listening on a TCP port next to
+# its share:
+#
+#   python search_daemon.py --address 0.0.0.0:9001 serve
+#
+# and the coordinator sends each worker the same query for its own root,
+# merging the streamed match, progress and error records into one stream.
+# Only bind workers to networks you trust: the daemon has no authentication.
+#
+# For a single-machine test, `python search_cluster.py local-workers 3`
+# starts three local daemons on consecutive ports.
+
+POLL_SECONDS = 0.2
+
+
+def parse_workers(text):
+    """Parse 'host:port=/path; host:port=/path' into [(address, path)]"""
+    workers = []
+    for item in text.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        address, sep, path = item.partition('=')
+        if not sep or not path.strip():
+            raise ValueError(f"Worker '{item}' must look like host:port=/path/on/worker")
+        workers.append((address.strip(), path.strip()))
+    return workers
+
+
+def cluster_search(params, workers, should_stop=None):
+    """Search every worker's root in parallel and yield merged records.
+
+    Match records gain a 'worker' field; a failing worker produces an
+    'error' record but does not stop the others. The final 'done' record
+    sums files and matches over all workers and lists failed ones. A
+    worker that cannot be reached or stays silent past the read timeout
+    counts as failed. On stop the worker connections are shut down and the
+    'done' record covers what arrived until then.
+    """
+    should_stop = should_stop or (lambda: False)
+    records = queue.Queue()
+    sockets = {}
+
+    def run_worker(address, root):
+        try:
+            stream = daemon_search(dict(params, source_loc=root), address,
+                                   on_connect=lambda sock: sockets.__setitem__(address, sock))
+            try:
+                for record in stream:
+                    if should_stop():
+                        break
+                    records.put((address, record))
+            finally:
+                stream.close()
+        except socket.timeout:
+            records.put((address, {'t': 'error', 'message': f"No answer for {READ_TIMEOUT} seconds"}))
+        except Exception as e:
+            records.put((address, {'t': 'error', 'message': str(e)}))
+        records.put((address, None))
+
+    for address, root in workers:
+        threading.Thread(target=run_worker, args=(address, root), daemon=True).start()
+
+    progress = {address: 0 for address, _ in workers}
+    running = set(progress)
+    failed = []
+    total_files = total_matches = 0
+    while running:
+        if should_stop():
+            for sock in list(sockets.values()):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            break
+        try:
+            address, record = records.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            continue
+        if record is None:
+            running.discard(address)
+            continue
+        if record['t'] == 'progress':
+            progress[address] = record['value']
+            yield {'t': 'progress', 'value': sum(progress.values()) // len(progress),
+                   'message': f"[{address}] {record['message']}"}
+        elif record['t'] == 'match':
+            yield dict(record, worker=address)
+        elif record['t'] == 'error':
+            failed.append(address)
+            yield dict(record, worker=address, message=f"[{address}] {record['message']}")
+        elif record['t'] == 'done':
+            progress[address] = 100
+            total_files += record.get('files', 0)
+            total_matches += record.get('matches', 0)
+    yield {'t': 'done', 'files': total_files, 'matches': total_matches, 'failed': failed}
+
+
+def start_local_workers(count, base_port=9001, host='127.0.0.1', timeout=15):
+    """Start count daemons on consecutive local ports, standing in for nodes"""
+    daemon_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_daemon.py')
+    processes, addresses = [], []
+    for port in range(base_port, base_port + count):
+        address = f"{host}:{port}"
+        processes.append(subprocess.Popen([sys.executable, daemon_script, '--address', address, 'serve']))
+        addresses.append(address)
+
+    deadline = time.monotonic() + timeout
+    for address in addresses:
+        while not daemon_available(address):
+            if time.monotonic() > deadline:
+                stop_local_workers(processes)
+                raise RuntimeError(f"Worker {address} did not start")
+            time.sleep(0.1)
+    return processes, addresses
+
+
+def stop_local_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search several worker daemons as one")
+    commands = parser.add_subparsers(dest='command', required=True)
+    local_cmd = commands.add_parser('local-workers', help="Run local worker daemons until interrupted")
+    local_cmd.add_argument('count', type=int)
+    local_cmd.add_argument('--base-port', type=int, default=9001)
+    search_cmd = commands.add_parser('search', help="Search all workers")
+    search_cmd.add_argument('search_string')
+    search_cmd.add_argument('--worker', action='append', required=True, metavar='HOST:PORT=PATH')
+    search_cmd.add_argument('--case-sensitive', action='store_true')
+    search_cmd.add_argument('--whole-word', action='store_true')
+    search_cmd.add_argument('--regex', action='store_true')
+    search_cmd.add_argument('--boolean', action='store_true', help="AND/OR/NOT/NEAR query")
+    search_cmd.add_argument('--index', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.command == 'local-workers':
+        processes, addresses = start_local_workers(args.count, args.base_port)
+        print("Workers listening on " + ', '.join(addresses))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_local_workers(processes)
+        return 0
+
+    params = {'search_string': args.search_string, 'case_sensitive': args.case_sensitive,
+              'whole_word': args.whole_word, 'use_regex': args.regex, 'boolean_query': args.boolean,
+              'use_index': args.index}
+    for record in cluster_search(params, parse_workers(';'.join(args.worker))):
+        if record['t'] == 'match':
+            print(f"{record['worker']}\t{record['path']}\t{record['occurrences']}\t"
+                  f"{record['status'] or record['locations']}")
+        elif record['t'] == 'error':
+            print(record['message'], file=sys.stderr)
+        elif record['t'] == 'done':
+            return 1 if record['failed'] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+import os
+import re
+import sys
+import json
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict
+
+from search_engine import (
+    build_regex, iter_text_units, search_file_steps, finish_steps, summarize_locations, file_signature,
+    discover_files, FileBudget
+)
+from trigram_index import TrigramIndex
+from query_language import QuerySyntaxError
+
+# Long-running search service. The daemon keeps extracted text and trigram
+# indexes warm between requests and serves any number of concurrent
+# clients (the GUI, the command line, other scripts) over a Unix domain
+# socket, or a localhost TCP port where Unix sockets are not available.
+#
+# Protocol: the client sends one JSON line, e.g.
+#   {"op": "search", "params": {"source_loc": ..., "search_string": ...}}
+# and reads JSON lines back until the connection closes:
+#   {"t": "progress", "value": 40, "message": "..."}
+#   {"t": "match", "path": ..., "occurrences": 3, "locations": "...", "offsets": [...], "status": null}
+#   {"t": "done", "files": 1200, "matches": 7}   or   {"t": "error", "message": "..."}
+# While a search runs the daemon also sends {"t": "alive"} every
+# HEARTBEAT_SECONDS, so clients can tell a silent phase (discovery,
+# indexing) from a stalled daemon and check for Stop in between.
+
+DAEMON_DIR = os.path.join(os.path.expanduser('~'), '.file_search')
+DEFAULT_ADDRESS = (os.path.join(DAEMON_DIR, 'daemon.sock') if hasattr(socket, 'AF_UNIX')
+                   else '127.0.0.1:8765')
+CACHE_CHARS = 256 * 1024 * 1024
+HEARTBEAT_SECONDS = 2
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+DEFAULT_FILE_TYPES = ('.txt', '.docx', '.xlsx', '.pdf', '.csv', '.tsv')
+
+
+def parse_address(address):
+    """'host:port' means TCP, anything else is a Unix socket path"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and os.sep not in host:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+# -------------------- Warm State --------------------
+class ExtractionCache:
+    """LRU of extracted text units keyed by path, bounded by total characters"""
+
+    def __init__(self, max_chars=CACHE_CHARS):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def units(self, file_path, extension, check=None, data=None, prefilter=None):
+        """Text units of a file like iter_text_units; cached units are all returned, whatever the prefilter.
+
+        Files too large to cache are streamed straight from iter_text_units,
+        so they never sit in daemon memory as a whole.
+        """
+        path = os.path.abspath(file_path)
+        signature = file_signature(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == signature:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if os.path.getsize(path) > self.max_chars // 4:
+            return iter_text_units(path, extension, check, data=data, prefilter=prefilter)
+        units = list(iter_text_units(path, extension, check, data=data))
+        size = sum(len(text) for _, _, text in units)
+        if size <= self.max_chars // 4:
+            with self.lock:
+                old = self.entries.pop(path, None)
+                if old:
+                    self.chars -= old[2]
+                self.entries[path] = (signature, units, size)
+                self.chars += size
+                while self.chars > self.max_chars:
+                    _, (_, _, evicted) = self.entries.popitem(last=False)
+                    self.chars -= evicted
+        return units
+
+
+class SearchService:
+    def __init__(self, cache_chars=CACHE_CHARS):
+        self.cache = ExtractionCache(cache_chars)
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def index_for(self, root):
+        """Shared TrigramIndex for a root with its lock, reloaded if changed on disk"""
+        root = os.path.abspath(root)
+        with self.lock:
+            index, lock, stamp = self.indexes.get(root, (None, None, None))
+            if index is None:
+                index, lock = TrigramIndex.for_root(root), threading.Lock()
+            table = os.path.join(index.directory, 'docs.json')
+            current = os.path.getmtime(table) if os.path.exists(table) else None
+            if stamp is not None and current != stamp:
+                index.close()
+                index = TrigramIndex(index.directory)
+            self.indexes[root] = (index, lock, current)
+            return index, lock
+
+    def search(self, params, emit, should_stop):
+        """Run one search, calling emit(record) for progress and each match"""
+        source_loc = params['source_loc']
+        regex = build_regex(params['search_string'], params.get('case_sensitive', False),
+                            params.get('whole_word', False), params.get('use_regex', False),
+                            params.get('boolean_query', False))
+        file_list = discover_files(source_loc, tuple(params.get('file_types') or DEFAULT_FILE_TYPES),
+                                   should_stop)
+
+        if params.get('use_index') and file_list:
+            index, lock = self.index_for(source_loc)
+            with lock:
+                stale = index.stale_files(file_list)
+                if stale:
+                    emit({'t': 'progress', 'value': 0, 'message': f"Indexing {len(stale)} new or changed files..."})
+                    index.update(stale, should_stop, extract=self.cache.units)
+                    self.indexes[os.path.abspath(source_loc)] = (
+                        index, lock, os.path.getmtime(os.path.join(index.directory, 'docs.json')))
+                candidates = index.candidates(regex)
+                if candidates is not None:
+                    file_list = [p for p in file_list
+                                 if os.path.abspath(p) in candidates or not index.is_current(p)]
+
+        total_files = len(file_list)
+        emit({'t': 'progress', 'value': 0, 'message': f"Found {total_files} files to search"})
+        matches = 0
+        try:
+            for i, file_path in enumerate(file_list):
+                if should_stop():
+                    break
+                budget = FileBudget(params.get('file_time_budget', 0), params.get('file_size_budget', 0),
+                                    should_stop)
+                extension = os.path.splitext(file_path)[1].lower()
+                occurrences, offsets, status = finish_steps(
+                    search_file_steps(file_path, extension, regex, budget, extract=self.cache.units))
+                if status == 'cancelled':
+                    break
+                if occurrences or status:
+                    matches += 1
+                    emit({'t': 'match', 'path': os.path.abspath(file_path), 'occurrences': occurrences,
+                          'locations': summarize_locations(offsets, occurrences), 'offsets': offsets,
+                          'status': status})
+                emit({'t': 'progress', 'value': int((i + 1) / total_files * 100),
+                      'message': f"Processing {os.path.basename(file_path)}..."})
+        finally:
+            if hasattr(regex, 'close'):
+                regex.close()
+        emit({'t': 'done', 'files': total_files, 'matches': matches})
+
+    def stats(self):
+        return {'t': 'stats', 'cached_files': len(self.cache.entries), 'cached_chars': self.cache.chars,
+                'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses,
+                'indexes': len(self.indexes)}
+
+
+# -------------------- Server --------------------
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        disconnected = threading.Event()
+        write_lock = threading.Lock()
+
+        def emit(record):
+            try:
+                with write_lock:
+                    self.wfile.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+            except OSError:
+                disconnected.set()
+
+        def heartbeat(finished):
+            while not finished.wait(HEARTBEAT_SECONDS) and not disconnected.is_set():
+                emit({'t': 'alive'})
+
+        try:
+            request = json.loads(self.rfile.readline())
+            op = request.get('op')
+            if op == 'ping':
+                emit({'t': 'pong', 'pid': os.getpid()})
+            elif op == 'stats':
+                emit(self.server.service.stats())
+            elif op == 'search':
+                finished = threading.Event()
+                threading.Thread(target=heartbeat, args=(finished,), daemon=True).start()
+                try:
+                    self.server.service.search(request['params'], emit, disconnected.is_set)
+                finally:
+                    finished.set()
+            elif op == 'shutdown':
+                emit({'t': 'done'})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                emit({'t': 'error', 'message': f"Unknown op {op!r}"})
+        except re.error as e:
+            emit({'t': 'error', 'message': f"Invalid regex: {e}"})
+        except QuerySyntaxError as e:
+            emit({'t': 'error', 'message': f"Invalid query: {e}"})
+        except Exception as e:
+            logging.error(f"Daemon request failed: {e}")
+            emit({'t': 'error', 'message': str(e)})
+
+
+class TCPDaemon(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixDaemon(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(address=DEFAULT_ADDRESS, service=None):
+    family, target = parse_address(address)
+    if family == socket.AF_UNIX:
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        if os.path.exists(target):
+            if daemon_available(address):
+                raise RuntimeError(f"A search daemon is already listening on {target}")
+            os.remove(target)
+        server = UnixDaemon(target, RequestHandler)
+    else:
+        server = TCPDaemon(target, RequestHandler)
+    server.service = service or SearchService()
+    return server
+
+
+def serve(address=DEFAULT_ADDRESS):
+    server = make_server(address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        family, target = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
+
+
+# -------------------- Client --------------------
+def request(payload, address=DEFAULT_ADDRESS, timeout=None, connect_timeout=None, on_connect=None):
+    """Send one request and yield the daemon's records as they arrive.
+
+    timeout limits every wait for data and connect_timeout (default
+    timeout) the connect; both raise socket.timeout. on_connect, if given,
+    is called with the connected socket so another thread can shut it down.
+    """
+    family, target = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout if connect_timeout is None else connect_timeout)
+        sock.connect(target)
+        sock.settimeout(timeout)
+        if on_connect:
+            on_connect(sock)
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def daemon_available(address=DEFAULT_ADDRESS):
+    try:
+        return any(r.get('t') == 'pong' for r in request({'op': 'ping'}, address, timeout=1))
+    except (OSError, ValueError):
+        return False
+
+
+def daemon_search(params, address=DEFAULT_ADDRESS, on_connect=None):
+    """Records of a search; socket.timeout if the daemon stops answering, heartbeats included"""
+    return request({'op': 'search', 'params': params}, address, READ_TIMEOUT, CONNECT_TIMEOUT, on_connect)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="File search daemon and command-line client")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help="Unix socket path or host:port (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', help="Run the daemon in the foreground")
+    commands.add_parser('stats', help="Show cache statistics")
+    commands.add_parser('stop', help="Shut the daemon down")
+    search_cmd = commands.add_parser('search', help="Search through the daemon")
+    search_cmd.add_argument('source_loc')
+    search_cmd.add_argument('search_string')
+    search_cmd.add_argument('--case-sensitive', action='store_true')
+    search_cmd.add_argument('--whole-word', action='store_true')
+    search_cmd.add_argument('--regex', action='store_true')
+    search_cmd.add_argument('--boolean', action='store_true', help="AND/OR/NOT/NEAR query")
+    search_cmd.add_argument('--index', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.address)
+        return 0
+    if args.command in ('stats', 'stop'):
+        for record in request({'op': 'shutdown' if args.command == 'stop' else 'stats'}, args.address):
+            print(json.dumps(record))
+        return 0
+
+    params = {'source_loc': os.path.abspath(args.source_loc), 'search_string': args.search_string,
+              'case_sensitive': args.case_sensitive, 'whole_word': args.whole_word,
+              'use_regex': args.regex, 'boolean_query': args.boolean, 'use_index': args.index}
+    for record in daemon_search(params, args.address):
+        if record['t'] == 'match':
+            print(f"{record['path']}\t{record['occurrences']}\t{record['status'] or record['locations']}")
+        elif record['t'] == 'error':
+            print(record['message'], file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,552 @@
+import io
+import os
+import re
+import csv
+import time
+import logging
+from docx import Document
+from PyPDF2 import PdfReader
+import openpyxl
+from regex_backend import compile_regex, required_literal, RegexTimeout, match_check
+from query_language import BooleanQuery, file_matcher
+
+# Text extraction and matching shared by the search tab and the search
+# index. Nothing in here depends on Qt, so it can run in helper processes.
+
+CSV_DELIMITERS = {'.csv': ',', '.tsv': '\t'}
+CSV_BLOCK = 1024 * 1024
+CSV_SENTINEL = '\x1e\x1f'
+
+
+def build_regex(search_string, case_sensitive, whole_word, use_regex, boolean=False):
+    """Compile the search box settings into a regex (raises re.error).
+
+    Risky user patterns get a backtracking-safe engine, see regex_backend.
+    With boolean set the search string is parsed as a BooleanQuery instead
+    (raises QuerySyntaxError).
+    """
+    if boolean:
+        return BooleanQuery(search_string, case_sensitive, whole_word)
+    flags = 0 if case_sensitive else re.IGNORECASE
+
+    if use_regex:
+        pattern = search_string
+    else:
+        pattern = re.escape(search_string)
+        if whole_word:
+            pattern = r'\b' + pattern + r'\b'
+
+    return compile_regex(pattern, flags)
+
+
+def raw_prefilter(regex):
+    """Plain re for the literal every match of regex contains, for searching raw CSV text; None if there is none"""
+    if isinstance(regex, BooleanQuery):
+        return None
+    literal, ignore_case = required_literal(regex.pattern, regex.flags)
+    # Quotes are doubled inside quoted CSV fields, so such literals are not found verbatim
+    if not literal or any(c in literal for c in '"\r\n'):
+        return None
+    return re.compile(re.escape(literal), re.IGNORECASE if ignore_case else 0)
+
+
+def file_signature(file_path):
+    try:
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+def discover_files(source_loc, file_types, should_stop=None):
+    """List the files under source_loc (or source_loc itself) with a wanted extension"""
+    if os.path.isfile(source_loc):
+        return [source_loc] if source_loc.lower().endswith(tuple(file_types)) else []
+
+    file_list = []
+    for root, _, files in os.walk(source_loc):
+        if should_stop and should_stop():
+            break
+        file_list.extend(
+            os.path.join(root, file)
+            for file in files
+            if file.lower().endswith(tuple(file_types))
+        )
+    return file_list
+
+
+class ExtractionAborted(Exception):
+    """Raised inside an extractor when the search is cancelled or a file exceeds its budget"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class FileBudget:
+    """Per-file time and size limits plus a cancellation callback.
+
+    Time only counts while the file is being worked on, so a file that is
+    paused between interleaved slices is not charged for other files.
+    """
+
+    def __init__(self, max_seconds=0, max_bytes=0, cancelled=None):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.cancelled = cancelled
+        self.spent = 0.0
+        self.running_since = None
+
+    def resume(self):
+        self.running_since = time.monotonic()
+
+    def pause(self):
+        if self.running_since is not None:
+            self.spent += time.monotonic() - self.running_since
+            self.running_since = None
+
+    def elapsed(self):
+        if self.running_since is None:
+            return self.spent
+        return self.spent + time.monotonic() - self.running_since
+
+    def check_size(self, file_path):
+        if self.max_bytes and os.path.getsize(file_path) > self.max_bytes:
+            raise ExtractionAborted('too large')
+
+    def check(self):
+        if self.cancelled and self.cancelled():
+            raise ExtractionAborted('cancelled')
+        if self.max_seconds and self.elapsed() > self.max_seconds:
+            raise ExtractionAborted('timed out')
+
+
+def _column_name(header, index):
+    return header[index] if index < len(header) else f"#{index + 1}"
+
+
+class RecordMismatch(Exception):
+    """Records found by counting quotes do not match what csv.reader reads"""
+
+
+def well_formed(delimiter):
+    """Regex for text of whole records that quote only as csv.reader reads them: plain or fully quoted fields"""
+    d = re.escape(delimiter)
+    field = f'(?:[^"{d}\\r\\n]*|"[^"]*(?:""[^"]*)*")'
+    return re.compile(f'(?:{field}(?:{d}{field})*\\r?\\n)*')
+
+
+def _complete_records(text):
+    """Length of the longest prefix of text (ending in a newline) that ends outside quotes, by counting them"""
+    cut = len(text) - 1
+    before = text.count('"', 0, cut)
+    while cut >= 0 and before % 2:
+        previous = text.rfind('\n', 0, cut)
+        before -= text.count('"', previous + 1, cut)
+        cut = previous
+    return cut + 1
+
+
+def _parse_record(record, delimiter):
+    """The one row of a raw record; raises RecordMismatch when csv.reader does not read exactly one row.
+
+    A sentinel record is parsed after it, as in csv_merge.parse_chunk: it
+    only comes back as a row of its own when the record closed all quotes.
+    """
+    if not record.endswith(('\n', '\r')):
+        record += '\n'
+    rows = list(csv.reader(io.StringIO(record + CSV_SENTINEL, newline=''), delimiter=delimiter))
+    if len(rows) != 2 or rows[1] != [CSV_SENTINEL]:
+        raise RecordMismatch()
+    return rows[0]
+
+
+def _count_rows(text, delimiter):
+    """Rows csv.reader reads from text (ending in a newline), or None if it ends inside a quoted field"""
+    if '"' not in text:
+        return text.count('\n')
+    rows = list(csv.reader(io.StringIO(text + CSV_SENTINEL, newline=''), delimiter=delimiter))
+    return len(rows) - 1 if rows and rows[-1] == [CSV_SENTINEL] else None
+
+
+class _RecordScanner:
+    """Finds the CSV records holding prefilter hits, block by block, and numbers them.
+
+    The text between hits is only counted by csv.reader; the record
+    holding a hit is cut out by counting quotes and checked to parse as
+    exactly one row. Where that is not possible (a hit inside a multi-line
+    record, a record running into the next block) lines are followed one
+    by one, again counting quotes and checking every record with quotes
+    that is not plainly well-formed. RecordMismatch is raised as soon as a
+    check fails, since the row numbers are off from there on.
+    """
+
+    def __init__(self, delimiter, prefilter):
+        self.delimiter = delimiter
+        self.search = prefilter.search
+        self.well_formed = well_formed(delimiter).fullmatch
+        self.row_number = 0
+        self.pending = []
+        self.quoted = False
+
+    def block(self, text):
+        """(row number, row) for the records of text (ending in a newline) that hold a hit"""
+        if self.pending:
+            yield from self.lines(text)
+            return
+        pos = 0
+        while True:
+            match = self.search(text, pos)
+            start = len(text) if match is None else max(pos, text.rfind('\n', pos, match.start()) + 1)
+            count = _count_rows(text[pos:start], self.delimiter)
+            if count is None:
+                yield from self.lines(text[pos:])
+                return
+            self.row_number += count
+            if match is None:
+                return
+            end = text.find('\n', start)
+            while end >= 0 and text.count('"', start, end) % 2:
+                end = text.find('\n', end + 1)
+            if end < 0:
+                yield from self.lines(text[start:])
+                return
+            self.row_number += 1
+            yield self.row_number, _parse_record(text[start:end + 1], self.delimiter)
+            pos = end + 1
+
+    def lines(self, text):
+        for line in text.split('\n')[:-1]:
+            line += '\n'
+            if not self.pending and '"' not in line:
+                self.row_number += 1
+                if self.search(line):
+                    yield self.row_number, _parse_record(line, self.delimiter)
+                continue
+            self.pending.append(line)
+            if line.count('"') % 2:
+                self.quoted = not self.quoted
+            if self.quoted:
+                continue
+            self.row_number += 1
+            record = ''.join(self.pending)
+            self.pending = []
+            if self.search(record):
+                yield self.row_number, _parse_record(record, self.delimiter)
+            elif not self.well_formed(record):
+                _parse_record(record, self.delimiter)
+
+    def finish(self):
+        """The record left open at the end of the file, if it holds a hit"""
+        if self.pending:
+            record = ''.join(self.pending)
+            row = _parse_record(record, self.delimiter)
+            if self.search(record):
+                yield self.row_number + 1, row
+
+
+def _csv_records(f, delimiter, prefilter, check):
+    """(row number, row) of the records after the header that prefilter finds something in.
+
+    The raw text is only trusted where every quote is where csv.reader
+    expects one: a field like "a"ba reads as aba, which the prefilter
+    cannot see. Text with quotes is checked up to its last complete
+    record, the rest together with the next block.
+    """
+    scanner = _RecordScanner(delimiter, prefilter)
+    is_well_formed = well_formed(delimiter).fullmatch
+    carry = ''
+    while True:
+        check()
+        block = f.read(CSV_BLOCK)
+        if not block:
+            break
+        block += f.readline()
+        if block.count('\r') != block.count('\r\n'):
+            raise RecordMismatch()
+        if not block.endswith('\n'):
+            block += '\n'
+        if carry or '"' in block:
+            text = carry + block
+            cut = _complete_records(text)
+            if not is_well_formed(text, 0, cut) or len(text) - cut > 4 * CSV_BLOCK:
+                raise RecordMismatch()
+            carry = text[cut:]
+        yield from scanner.block(block)
+    if carry:
+        raise RecordMismatch()
+    yield from scanner.finish()
+
+
+def _row_cells(header, number, row):
+    for i, value in enumerate(row):
+        if value:
+            yield 'Row', (number, _column_name(header, i), i), value
+
+
+def _iter_csv_cells(f, delimiter, check, prefilter):
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    done = 0
+    if prefilter is not None:
+        try:
+            for number, row in _csv_records(f, delimiter, prefilter, check):
+                yield from _row_cells(header, number, row)
+                done = number
+            return
+        except RecordMismatch:
+            # Rows up to the last one yielded were numbered correctly; read the rest properly
+            f.seek(0)
+            reader = csv.reader(f, delimiter=delimiter)
+            next(reader, None)
+    for number, row in enumerate(reader, start=1):
+        check()
+        if number > done:
+            yield from _row_cells(header, number, row)
+
+
+def iter_text_units(file_path, extension, check=None, data=None, prefilter=None):
+    """Yield (kind, key, text) for every searchable unit of a file.
+
+    Units are lines for .txt, paragraphs for .docx, cells for .xlsx (key is
+    (sheet name, coordinate)), pages for .pdf and fields for .csv and .tsv
+    (key is (row, column name, column index), rows counted after the
+    header). Matches never span units.
+    check, if given, is called inside every loop and may raise
+    ExtractionAborted to stop extraction part-way through a file. data, if
+    given, is the file's content already read into memory (see prefetch).
+    prefilter, a regex from raw_prefilter, skips CSV rows whose raw text it
+    finds nothing in; leave it out when every unit is needed.
+    """
+    check = check or (lambda: None)
+    source = file_path if data is None else io.BytesIO(data)
+
+    if extension == '.txt':
+        if data is None:
+            f = open(file_path, 'r', encoding='utf-8', errors='ignore')
+        else:
+            f = io.TextIOWrapper(source, encoding='utf-8', errors='ignore')
+        with f:
+            for i, line in enumerate(f, start=1):
+                check()
+                yield 'Line', i, line
+
+    elif extension in CSV_DELIMITERS:
+        if data is None:
+            f = open(file_path, 'r', encoding='utf-8-sig', errors='ignore', newline='')
+        else:
+            f = io.TextIOWrapper(source, encoding='utf-8-sig', errors='ignore', newline='')
+        with f:
+            yield from _iter_csv_cells(f, CSV_DELIMITERS[extension], check, prefilter)
+
+    elif extension == '.docx':
+        doc = Document(source)
+        for i, para in enumerate(doc.paragraphs, start=1):
+            check()
+            yield 'Paragraph', i, para.text
+
+    elif extension == '.xlsx':
+        workbook = openpyxl.load_workbook(source, read_only=True)
+        try:
+            for sheet_name in workbook.sheetnames:
+                sheet = workbook[sheet_name]
+                for row in sheet.iter_rows():
+                    check()
+                    for cell in row:
+                        if cell.value:
+                            yield 'Cell', (sheet_name, cell.coordinate), str(cell.value)
+        finally:
+            workbook.close()
+
+    elif extension == '.pdf':
+        reader = PdfReader(source)
+        for i, page in enumerate(reader.pages, start=1):
+            check()
+            yield 'Page', i, page.extract_text() or ""
+
+
+def format_location(kind, key, pos):
+    if kind == 'Cell':
+        return f"Sheet '{key[0]}' Cell {key[1]}"
+    if kind == 'Row':
+        return f"Row {key[0]}, Column '{key[1]}'"
+    return f"{kind} {key} (Pos {pos+1})"
+
+
+# -------------------- Match Offsets --------------------
+# A scan keeps only the first MAX_OFFSETS matches of a file as compact
+# (kind, key, start, end) tuples. Location text is formatted for the few
+# shown in the table, and context snippets are read back on demand.
+MAX_OFFSETS = 20
+CONTEXT_CHARS = 80
+LINE_CHUNK = 1024 * 1024
+
+
+def add_offset(offsets, kind, key, match):
+    if len(offsets) < MAX_OFFSETS:
+        offsets.append((kind, key, match.start(), match.end()))
+
+
+def summarize_locations(offsets, occurrences, limit=3):
+    text = ', '.join(format_location(kind, key, start) for kind, key, start, _ in offsets[:limit])
+    return text + ('...' if occurrences > limit else '')
+
+
+def _read_line(file_path, number):
+    """Line number (1-based) of a text file, reading only up to that line"""
+    with open(file_path, 'rb') as f:
+        offset = 0
+        remaining = number - 1
+        while remaining:
+            chunk = f.read(LINE_CHUNK)
+            if not chunk:
+                return ''
+            count = chunk.count(b'\n')
+            if count < remaining:
+                remaining -= count
+                offset += len(chunk)
+                continue
+            pos = -1
+            for _ in range(remaining):
+                pos = chunk.index(b'\n', pos + 1)
+            offset += pos + 1
+            break
+        f.seek(offset)
+        return f.readline().decode('utf-8', errors='ignore')
+
+
+def _read_field(file_path, number, index):
+    """Field index of data row number (1-based, after the header) of a CSV or TSV file"""
+    delimiter = CSV_DELIMITERS.get(os.path.splitext(file_path)[1].lower(), ',')
+    with open(file_path, 'r', encoding='utf-8-sig', errors='ignore', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        next(reader, None)
+        for i, row in enumerate(reader, start=1):
+            if i == number:
+                return row[index] if index < len(row) else ''
+    return ''
+
+
+def read_unit(file_path, kind, key):
+    """Text of one unit (line, paragraph, cell or page) without extracting the rest"""
+    if kind == 'Line':
+        return _read_line(file_path, key)
+    if kind == 'Paragraph':
+        paragraphs = Document(file_path).paragraphs
+        return paragraphs[key - 1].text if key <= len(paragraphs) else ''
+    if kind == 'Cell':
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            value = workbook[key[0]][key[1]].value
+            return '' if value is None else str(value)
+        finally:
+            workbook.close()
+    if kind == 'Row':
+        return _read_field(file_path, key[0], key[2])
+    if kind == 'Page':
+        pages = PdfReader(file_path).pages
+        return (pages[key - 1].extract_text() or '') if key <= len(pages) else ''
+    return ''
+
+
+def match_context(file_path, offsets, context=CONTEXT_CHARS):
+    """[(location, before, match, after)] for recorded offsets, reading each unit once"""
+    snippets, units = [], {}
+    for kind, key, start, end in offsets:
+        unit = (kind, tuple(key) if isinstance(key, list) else key)
+        if unit not in units:
+            units[unit] = read_unit(file_path, *unit)
+        text = units[unit]
+        snippets.append((format_location(kind, unit[1], start), text[max(start - context, 0):start],
+                         text[start:end], text[end:end + context]))
+    return snippets
+
+
+def search_file_steps(file_path, extension, regex, budget, data=None, summary=None, stats=None,
+                      slice_seconds=None, extract=iter_text_units):
+    """Search one file, as a generator shared by the search tab, the daemon and parser processes.
+
+    Yields each time a time slice (slice_seconds, None for no slices) is
+    used up so the caller can switch to another file, and returns
+    (occurrences, offsets, status) when done. offsets holds the first
+    matches as (kind, key, start, end) and status is None, or the reason
+    the budget (a FileBudget) abandoned the file part-way. A summary builder,
+    if given, is fed every text unit and marked complete at the end; stats
+    (a ranking.DocumentStats) collects the length and term hits used for
+    ranking. extract has the signature of iter_text_units.
+    """
+    occurrences, offsets = 0, []
+    matcher = file_matcher(regex)
+    try:
+        budget.resume()
+        budget.check_size(file_path)
+        deadline = time.monotonic() + slice_seconds if slice_seconds else None
+        prefilter = None
+        if extension in CSV_DELIMITERS and summary is None and stats is None:
+            prefilter = raw_prefilter(regex)
+
+        for kind, key, text in extract(file_path, extension, budget.check, data, prefilter):
+            budget.check()
+            if summary is not None:
+                summary.add_text(text)
+            if stats is not None:
+                stats.add_text(text)
+            with match_check(budget.check):
+                matches = matcher.feed(text)
+            for match in matches:
+                occurrences += 1
+                add_offset(offsets, kind, key, match)
+                if stats is not None:
+                    stats.hit(match)
+            if matcher.rejected and summary is None:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                budget.pause()
+                yield
+                budget.resume()
+                deadline = time.monotonic() + slice_seconds
+
+        if summary is not None:
+            summary.complete = True
+        if not matcher.accepted():
+            return 0, [], None
+        return occurrences, offsets, None
+
+    except (ExtractionAborted, RegexTimeout) as e:
+        return occurrences, offsets, e.reason
+
+    except Exception as e:
+        logging.error(f"Error processing {file_path}: {e}")
+        return 0, [], None
+
+
+def finish_steps(steps):
+    """Run a search_file_steps generator to the end and return its result"""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+
+_regexes = {}
+
+
+def search_file(file_path, extension, pattern, flags, data=None, max_seconds=0, max_bytes=0, summary=None,
+                stats=None, cancelled=None):
+    """Search one file start to finish, for use in parser processes.
+
+    Returns (occurrences, offsets, status) like search_file_steps. pattern
+    is a regex string or a BooleanQuery, compiled here (and cached) since
+    compiled regexes do not pickle. cancelled is the FileBudget callback.
+    """
+    if isinstance(pattern, BooleanQuery):
+        regex = pattern
+    else:
+        regex = _regexes.get((pattern, flags))
+        if regex is None:
+            regex = _regexes[(pattern, flags)] = compile_regex(pattern, flags)
+    budget = FileBudget(max_seconds, max_bytes, cancelled)
+    return finish_steps(search_file_steps(file_path, extension, regex, budget, data, summary, stats))
@@ -0,0 +1,545 @@
+import os
+import json
+import mmap
+import heapq
+import struct
+import hashlib
+import logging
+import contextlib
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from search_engine import iter_text_units, file_signature, FileBudget
+from query_language import BooleanQuery
+
+# Trigram index in the style of codesearch: every indexed file is reduced to
+# the set of byte trigrams of its lower-cased UTF-8 text. A regex is turned
+# into an AND/OR query over trigrams that any matching file must satisfy, so
+# only the candidate files have to be searched with the real regex.
+#
+# On disk an index is a docs.json table (doc id -> path, size, mtime, words) plus
+# immutable segments. Each segment has a sorted lexicon of fixed-size
+# entries (trigram, offset, length) and a postings file of varint
+# delta-encoded doc ids; both are memory-mapped for lookups. Updates append
+# a new segment and retire the old doc ids, and segments are merged once
+# there are too many of them.
+#
+# The GUI and the search daemon may update the same index. Loading,
+# updating and compacting hold an exclusive lock on the index directory's
+# lock file, and an update reloads docs.json under it first, so segment
+# names are never handed out twice and no live segment is rewritten.
+
+INDEX_DIR = os.path.join(os.path.expanduser('~'), '.file_search', 'trigram_index')
+LEX_ENTRY = struct.Struct('<3sQI')
+MAX_SEGMENTS = 8
+SEGMENT_POSTINGS = 2000000
+MAX_SET = 16
+
+ALL = ('all',)
+
+
+# -------------------- Posting Lists --------------------
+def encode_postings(doc_ids):
+    out = bytearray()
+    prev = 0
+    for doc_id in doc_ids:
+        delta = doc_id - prev
+        prev = doc_id
+        while delta >= 0x80:
+            out.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(buf):
+    doc_ids = []
+    prev = value = shift = 0
+    for byte in buf:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += value
+        doc_ids.append(prev)
+        value = shift = 0
+    return doc_ids
+
+
+def text_trigrams(text):
+    data = text.lower().encode('utf-8')
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+class Segment:
+    def __init__(self, directory, name):
+        self.name = name
+        self.lex_path = os.path.join(directory, name + '.lex')
+        self.post_path = os.path.join(directory, name + '.post')
+        self.lex = self._map(self.lex_path)
+        self.post = self._map(self.post_path)
+        self.count = len(self.lex) // LEX_ENTRY.size
+
+    @staticmethod
+    def _map(path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _entry(self, i):
+        return LEX_ENTRY.unpack_from(self.lex, i * LEX_ENTRY.size)
+
+    def postings(self, trigram):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.lex[mid * LEX_ENTRY.size:mid * LEX_ENTRY.size + 3] < trigram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            key, offset, length = self._entry(lo)
+            if key == trigram:
+                return decode_postings(self.post[offset:offset + length])
+        return []
+
+    def __iter__(self):
+        for i in range(self.count):
+            key, offset, length = self._entry(i)
+            yield key, decode_postings(self.post[offset:offset + length])
+
+    def close(self):
+        for m in (self.lex, self.post):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    @staticmethod
+    def write(directory, name, entries):
+        """Write sorted (trigram, doc_ids) pairs as a new segment"""
+        offset = 0
+        with open(os.path.join(directory, name + '.post'), 'wb') as post, \
+                open(os.path.join(directory, name + '.lex'), 'wb') as lex:
+            for trigram, doc_ids in entries:
+                data = encode_postings(doc_ids)
+                post.write(data)
+                lex.write(LEX_ENTRY.pack(trigram, offset, len(data)))
+                offset += len(data)
+
+
+# -------------------- Index Lock --------------------
+def _lock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after about ten seconds
+                continue
+    import fcntl
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# -------------------- Index --------------------
+class TrigramIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        self._held = None
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            self._load()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the index directory's lock; nested uses on one index share it"""
+        if self._held is not None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'lock'), 'a+b') as f:
+            _lock_file(f)
+            self._held = f
+            try:
+                yield
+            finally:
+                self._held = None
+                _unlock_file(f)
+
+    def _load(self):
+        """(Re)read docs.json and map its segments; call with the lock held"""
+        self.close()
+        self.docs = []
+        self.segment_names = []
+        self.next_segment = 0
+        table = os.path.join(self.directory, 'docs.json')
+        if os.path.exists(table):
+            with open(table, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.docs = state['docs']
+            self.segment_names = state['segments']
+            self.next_segment = state['next_segment']
+        self.segments = [Segment(self.directory, name) for name in self.segment_names]
+        self.doc_ids = {doc[0]: i for i, doc in enumerate(self.docs) if doc}
+
+    @classmethod
+    def for_root(cls, root, base_dir=INDEX_DIR):
+        key = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:16]
+        return cls(os.path.join(base_dir, key))
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+    def _save(self):
+        table = os.path.join(self.directory, 'docs.json')
+        with open(table + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'docs': self.docs, 'segments': self.segment_names,
+                       'next_segment': self.next_segment}, f, separators=(',', ':'))
+        os.replace(table + '.tmp', table)
+
+    def is_current(self, file_path):
+        doc_id = self.doc_ids.get(os.path.abspath(file_path))
+        if doc_id is None:
+            return False
+        signature = file_signature(file_path)
+        return bool(signature) and tuple(self.docs[doc_id][1:3]) == signature
+
+    def stale_files(self, file_list):
+        return [path for path in file_list if not self.is_current(path)]
+
+    def update(self, file_list, should_stop=None, extract=iter_text_units):
+        """Index new or changed files and forget files that no longer exist.
+
+        extract has the signature of iter_text_units, so callers with an
+        extraction cache can reuse it. Changes another process saved since
+        this index was loaded are picked up first.
+        """
+        with self._locked():
+            self._load()
+            self._update(file_list, should_stop, extract)
+
+    def _update(self, file_list, should_stop, extract):
+        wanted = {os.path.abspath(path) for path in file_list}
+        for path, doc_id in list(self.doc_ids.items()):
+            if path not in wanted and not os.path.exists(path):
+                self._retire(path)
+
+        budget = FileBudget(cancelled=should_stop)
+        postings = {}
+        pending = 0
+        for file_path in file_list:
+            if should_stop and should_stop():
+                break
+            path = os.path.abspath(file_path)
+            signature = file_signature(path)
+            try:
+                extension = os.path.splitext(path)[1].lower()
+                text = '\n'.join(text for _, _, text in extract(path, extension, budget.check))
+                trigrams = text_trigrams(text)
+            except Exception as e:
+                logging.error(f"Error indexing {path}: {e}")
+                continue
+
+            self._retire(path)
+            doc_id = len(self.docs)
+            self.docs.append([path, *(signature or (None, None)), len(text.split())])
+            self.doc_ids[path] = doc_id
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(doc_id)
+            pending += len(trigrams)
+            if pending >= SEGMENT_POSTINGS:
+                self._add_segment(postings)
+                postings, pending = {}, 0
+
+        if postings:
+            self._add_segment(postings)
+        if len(self.segments) > MAX_SEGMENTS or self.dead_docs() > len(self.docs) // 2:
+            self._compact()
+        self._save()
+
+    def _retire(self, path):
+        doc_id = self.doc_ids.pop(path, None)
+        if doc_id is not None:
+            self.docs[doc_id] = None
+
+    def dead_docs(self):
+        return len(self.docs) - len(self.doc_ids)
+
+    def _add_segment(self, postings):
+        name = f"seg-{self.next_segment:05d}"
+        self.next_segment += 1
+        Segment.write(self.directory, name, sorted(postings.items()))
+        self.segment_names.append(name)
+        self.segments.append(Segment(self.directory, name))
+        self._save()
+
+    def compact(self):
+        """Merge all segments into one, dropping retired doc ids"""
+        with self._locked():
+            self._load()
+            self._compact()
+
+    def _compact(self):
+        remap, docs = {}, []
+        for doc_id, doc in enumerate(self.docs):
+            if doc:
+                remap[doc_id] = len(docs)
+                docs.append(doc)
+
+        def merged():
+            # Doc ids grow with segment order, so concatenating per trigram
+            # in segment order keeps the posting lists sorted.
+            streams = [((key, order, ids) for key, ids in segment)
+                       for order, segment in enumerate(self.segments)]
+            current, doc_ids = None, []
+            for key, _, ids in heapq.merge(*streams):
+                if key != current:
+                    if doc_ids:
+                        yield current, doc_ids
+                    current, doc_ids = key, []
+                doc_ids.extend(remap[i] for i in ids if i in remap)
+            if doc_ids:
+                yield current, doc_ids
+
+        name = f"seg-{self.next_segment:05d}"
+        self.next_segment += 1
+        Segment.write(self.directory, name, merged())
+
+        old_segments = self.segments
+        self.docs = docs
+        self.doc_ids = {doc[0]: i for i, doc in enumerate(docs)}
+        self.segment_names = [name]
+        self.segments = [Segment(self.directory, name)]
+        self._save()
+        for segment in old_segments:
+            segment.close()
+            os.remove(segment.lex_path)
+            os.remove(segment.post_path)
+
+    def lookup(self, trigram):
+        doc_ids = set()
+        for segment in self.segments:
+            doc_ids.update(segment.postings(trigram))
+        return doc_ids
+
+    def evaluate(self, query):
+        """Doc ids satisfying a trigram query, or None if it cannot narrow"""
+        if query == ALL:
+            return None
+        if isinstance(query, bytes):
+            return self.lookup(query)
+        op, args = query
+        if op == 'and':
+            result = None
+            for sub in args:
+                doc_ids = self.evaluate(sub)
+                if doc_ids is None:
+                    continue
+                result = doc_ids if result is None else result & doc_ids
+                if not result:
+                    break
+            return result
+        result = set()
+        for sub in args:
+            doc_ids = self.evaluate(sub)
+            if doc_ids is None:
+                return None
+            result |= doc_ids
+        return result
+
+    def corpus_stats(self):
+        """(documents, average length in words) for ranking, or None for old indexes"""
+        lengths = [doc[3] for doc in self.docs if doc and len(doc) > 3]
+        if not lengths:
+            return None
+        return len(self.doc_ids), sum(lengths) / len(lengths) or 1
+
+    def document_frequency(self, regex):
+        """Number of indexed files that may contain a match, or None if unknown"""
+        doc_ids = self.evaluate(regex_query(regex))
+        return None if doc_ids is None else sum(1 for i in doc_ids if self.docs[i])
+
+    def candidates(self, regex):
+        """Absolute paths of indexed files that may match, or None for all"""
+        doc_ids = self.evaluate(regex_query(regex))
+        if doc_ids is None:
+            return None
+        return {self.docs[i][0] for i in doc_ids if self.docs[i]}
+
+
+# -------------------- Regex Analysis --------------------
+def _and(*queries):
+    args = []
+    for q in queries:
+        if q == ALL:
+            continue
+        if not isinstance(q, bytes) and q[0] == 'and':
+            args.extend(q[1])
+        elif q not in args:
+            args.append(q)
+    if not args:
+        return ALL
+    return args[0] if len(args) == 1 else ('and', tuple(args))
+
+
+def _or(*queries):
+    args = []
+    for q in queries:
+        if q == ALL:
+            return ALL
+        if not isinstance(q, bytes) and q[0] == 'or':
+            args.extend(q[1])
+        elif q not in args:
+            args.append(q)
+    return args[0] if len(args) == 1 else ('or', tuple(args))
+
+
+def _strings_query(strings):
+    """Query requiring at least one of the strings to occur"""
+    alternatives = []
+    for s in strings:
+        trigrams = text_trigrams(s)
+        if not trigrams:
+            return ALL
+        alternatives.append(_and(*sorted(trigrams)))
+    return _or(*alternatives) if alternatives else ALL
+
+
+class _Info:
+    """What is known about the strings a regex fragment can match.
+
+    Either the exact set of strings, or a set of possible prefixes and
+    suffixes (at most two characters each) plus a query that any file
+    containing a match must satisfy.
+    """
+
+    def __init__(self, exact=None, prefix=None, suffix=None, match=ALL):
+        self.exact = exact
+        self.prefix = prefix
+        self.suffix = suffix
+        self.match = match
+
+
+def _any():
+    return _Info(None, {''}, {''}, ALL)
+
+
+def _cap(strings):
+    return strings if len(strings) <= MAX_SET else {''}
+
+
+def _inexact(info):
+    if info.exact is None:
+        return info
+    return _Info(None, _cap({s[:2] for s in info.exact}), _cap({s[-2:] for s in info.exact}),
+                 _and(info.match, _strings_query(info.exact)))
+
+
+def _concat(x, y):
+    if x.exact is not None and y.exact is not None and len(x.exact) * len(y.exact) <= MAX_SET:
+        return _Info({a + b for a in x.exact for b in y.exact}, match=_and(x.match, y.match))
+    x_exact, y_exact = x.exact, y.exact
+    x, y = _inexact(x), _inexact(y)
+    prefix = {(a + p)[:2] for a in x_exact for p in y.prefix} if x_exact is not None else x.prefix
+    suffix = {(s + b)[-2:] for s in x.suffix for b in y_exact} if y_exact is not None else y.suffix
+    match = _and(x.match, y.match)
+    if len(x.suffix) * len(y.prefix) <= MAX_SET:
+        match = _and(match, _strings_query({s + p for s in x.suffix for p in y.prefix}))
+    return _Info(None, _cap(prefix), _cap(suffix), match)
+
+
+def _alternate(x, y):
+    if x.exact is not None and y.exact is not None and len(x.exact | y.exact) <= MAX_SET:
+        return _Info(x.exact | y.exact, match=_or(x.match, y.match))
+    x, y = _inexact(x), _inexact(y)
+    return _Info(None, _cap(x.prefix | y.prefix), _cap(x.suffix | y.suffix), _or(x.match, y.match))
+
+
+def _char_class(items):
+    chars = set()
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            chars.add(chr(av).lower())
+        elif op == sre_parse.RANGE and av[1] - av[0] < MAX_SET:
+            chars.update(chr(c).lower() for c in range(av[0], av[1] + 1))
+        else:
+            return _any()
+        if len(chars) > MAX_SET:
+            return _any()
+    return _Info(chars)
+
+
+def _analyze(subpattern):
+    info = _Info({''})
+    for op, av in subpattern:
+        info = _concat(info, _analyze_item(op, av))
+    return info
+
+
+def _analyze_item(op, av):
+    if op == sre_parse.LITERAL:
+        return _Info({chr(av).lower()})
+    if op == sre_parse.IN:
+        return _char_class(av)
+    if op == sre_parse.SUBPATTERN:
+        return _analyze(av[-1])
+    if op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return _analyze(av)
+    if op == sre_parse.BRANCH:
+        infos = [_analyze(branch) for branch in av[1]]
+        info = infos[0]
+        for other in infos[1:]:
+            info = _alternate(info, other)
+        return info
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+        low, high, item = av
+        inner = _analyze(item)
+        if low == high == 1:
+            return inner
+        if low == 0:
+            return _alternate(_Info({''}), inner) if high == 1 else _any()
+        inner = _inexact(inner)
+        return _Info(None, inner.prefix, inner.suffix, inner.match)
+    if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return _Info({''})
+    return _any()
+
+
+def regex_query(regex):
+    """Trigram query that every file containing a match of regex satisfies"""
+    if isinstance(regex, BooleanQuery):
+        return _boolean_query(regex, regex.tree)
+    try:
+        info = _analyze(sre_parse.parse(regex.pattern, regex.flags))
+    except Exception as e:
+        logging.error(f"Could not analyze regex {regex.pattern!r}: {e}")
+        return ALL
+    return _inexact(info).match
+
+
+def _boolean_query(query, node):
+    """Terms become posting-list intersections and unions; NOT cannot narrow"""
+    op = node[0]
+    if op == 'term':
+        return regex_query(query.terms[node[1]][1])
+    if op == 'near':
+        return _and(regex_query(query.terms[node[2]][1]), regex_query(query.terms[node[3]][1]))
+    if op == 'not':
+        return ALL
+    queries = [_boolean_query(query, sub) for sub in node[1]]
+    return _and(*queries) if op == 'and' else _or(*queries)
@@ -0,0 +1,58 @@
+import csv
+import random
+
+import pytest
+
+import search_engine
+from search_engine import build_regex, iter_text_units, raw_prefilter
+
+
+def matches(path, extension, search_string, use_prefilter):
+    regex = build_regex(search_string, False, False, False)
+    prefilter = raw_prefilter(regex) if use_prefilter else None
+    return [(key, text) for _, key, text in iter_text_units(str(path), extension, prefilter=prefilter)
+            if regex.search(text)]
+
+
+def reference(path, delimiter, search_string):
+    """Every field csv.reader reads that contains search_string, as (row, column, index) keys"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f, delimiter=delimiter))
+    header = rows[0] if rows else []
+    return [((number, header[i] if i < len(header) else f"#{i + 1}", i), value)
+            for number, row in enumerate(rows[1:], start=1)
+            for i, value in enumerate(row) if value and search_string in value.lower()]
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_bytes(text.encode('utf-8'))
+    return path
+
+
+def test_quoted_then_unquoted_field_is_found(tmp_path):
+    path = write(tmp_path, 'mixed.csv', 'id,text\n1,"a"ba,\n2,ab\n')
+    expected = reference(path, ',', 'ab')
+    assert [key[0] for key, _ in expected] == [1, 2]
+    assert matches(path, '.csv', 'ab', True) == expected
+
+
+def test_stray_quotes_keep_row_numbers(tmp_path):
+    path = write(tmp_path, 'stray.csv', 'id,text\n1,5" screen\n2,bar\n3,12" pipe\n4,foo\n5,x"y,"z\n6,foo\n')
+    assert matches(path, '.csv', 'foo', True) == reference(path, ',', 'foo')
+
+
+@pytest.mark.parametrize('block', [16, 64, 1024 * 1024])
+@pytest.mark.parametrize('extension, delimiter', [('.csv', ','), ('.tsv', '\t')])
+def test_prefilter_matches_full_parse(tmp_path, monkeypatch, block, extension, delimiter):
+    monkeypatch.setattr(search_engine, 'CSV_BLOCK', block)
+    pieces = ['fo', 'o', 'foo', 'a', '"', '""', delimiter, '\n', '\r\n', ' ', 'x']
+    rng = random.Random(block)
+    for n in range(200):
+        text = 'id' + delimiter + 'text\n' + ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 80)))
+        path = write(tmp_path, f'data{n}{extension}', text)
+        assert matches(path, extension, 'foo', True) == reference(path, delimiter, 'foo'), repr(text)
+
+
+def test_location_format():
+    assert search_engine.format_location('Row', (10234, 'email', 2), 0) == "Row 10234, Column 'email'"
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from output_modes import materialize_file
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+@pytest.mark.parametrize('link_mode', ['hardlink', 'symlink'])
+def test_copy_over_earlier_link_leaves_link_target_alone(tmp_path, link_mode):
+    first = write(tmp_path / 'A' / 'r.txt', 'from A')
+    second = write(tmp_path / 'B' / 'r.txt', 'from B')
+    dest = tmp_path / 'out' / 'r.txt'
+    dest.parent.mkdir()
+    try:
+        assert materialize_file(str(first), str(dest), link_mode) == link_mode
+    except OSError:
+        pytest.skip(f'{link_mode} not supported here')
+    assert materialize_file(str(second), str(dest), 'copy') == 'copy'
+    assert first.read_text() == 'from A'
+    assert dest.read_text() == 'from B'
+    assert not os.path.islink(dest)
+
+
+def test_saving_into_the_source_folder_keeps_the_file(tmp_path):
+    source = write(tmp_path / 'r.txt', 'data')
+    for mode in ('copy', 'hardlink', 'symlink'):
+        materialize_file(str(source), str(tmp_path / 'r.txt'), mode)
+        assert source.read_text() == 'data'
+        assert not os.path.islink(source)
@@ -0,0 +1,82 @@
+import itertools
+import random
+import re
+
+import pytest
+
+from query_language import BooleanQuery, QuerySyntaxError
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta']
+
+
+def brute_force(query, units):
+    """Evaluate query.tree directly on the words of the file"""
+    words = [w for unit in units for w in re.findall(r'\w+', unit.lower())]
+    positions = {word: [i for i, w in enumerate(words) if w == word] for word in set(words)}
+
+    def term_word(i):
+        return query.terms[i][0].lower()
+
+    def evaluate(node):
+        op = node[0]
+        if op == 'term':
+            return term_word(node[1]) in positions
+        if op == 'near':
+            distance, a, b = node[1:]
+            return any(abs(x - y) <= distance
+                       for x, y in itertools.product(positions.get(term_word(a), []), positions.get(term_word(b), [])))
+        if op == 'not':
+            return not evaluate(node[1])
+        values = [evaluate(sub) for sub in node[1]]
+        return all(values) if op == 'and' else any(values)
+
+    return evaluate(query.tree)
+
+
+def run(query, units):
+    matcher = query.start_file()
+    for unit in units:
+        matcher.feed(unit)
+        if matcher.rejected:
+            break
+    return matcher.accepted()
+
+
+def random_query(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        if rng.random() < 0.25:
+            return f"{rng.choice(WORDS)} NEAR/{rng.randint(0, 4)} {rng.choice(WORDS)}"
+        return rng.choice(WORDS)
+    op = rng.choice(['AND', 'OR', 'NOT', ''])
+    left, right = random_query(rng, depth + 1), random_query(rng, depth + 1)
+    if op == 'NOT':
+        return f"{left} NOT ({right})"
+    return f"({left}) {op} ({right})".replace('  ', ' ')
+
+
+def test_parse_tree():
+    query = BooleanQuery('alpha beta OR NOT gamma delta')
+    assert query.tree == ('or', (('and', (('term', 0), ('term', 1))), ('and', (('not', ('term', 2)), ('term', 3)))))
+    assert BooleanQuery('alpha NEAR beta').tree == ('near', 10, 0, 1)
+    assert BooleanQuery('"alpha  beta" gamma').terms[0][0] == 'alpha  beta'
+
+
+@pytest.mark.parametrize('text', ['', 'NOT alpha', 'alpha AND', '(alpha', 'alpha NEAR (beta OR gamma)', '""'])
+def test_syntax_errors(text):
+    with pytest.raises(QuerySyntaxError):
+        BooleanQuery(text)
+
+
+def test_matcher_agrees_with_brute_force():
+    rng = random.Random(38)
+    checked = 0
+    while checked < 400:
+        try:
+            query = BooleanQuery(random_query(rng), whole_word=True)
+        except QuerySyntaxError:
+            continue
+        for _ in range(5):
+            units = [' '.join(rng.choice(WORDS + ['x', 'y']) for _ in range(rng.randint(0, 6)))
+                     for _ in range(rng.randint(1, 4))]
+            assert run(query, units) == brute_force(query, units), (query.pattern, units)
+        checked += 1
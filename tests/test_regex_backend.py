@@ -0,0 +1,54 @@
+import random
+import re
+
+import pytest
+
+from regex_backend import classify_pattern, compile_regex, required_literal, GuardedRegex
+
+REDOS_SHAPES = [
+    r'(a+)+$', r'(a*)*b', r'(a|aa)+$', r'(\w+\s?)+$', r'(.*a){10}', r'(a|a)*b', r'(x+x+)+y',
+    r'a*a*a*a*a*a*b', r'.*a.*a.*a.*b', r'.*foo.*bar.*baz', r'\d+-?\d+', r'(\w)\1+',
+]
+SAFE_SHAPES = [r'fo+o', r'\d+-\d+', r'\w+\s+\w+', r'\w+@\w+\.\w+', r'[a-z]+\d+', r'^\s*#.*$', r'[^,]*,[^,]*',
+               r'x.*y', r'\b\w+\b', r'\d+\.\d+']
+
+
+@pytest.mark.parametrize('pattern', REDOS_SHAPES)
+def test_redos_shapes_are_risky(pattern):
+    assert classify_pattern(pattern)[0] == 'risky'
+
+
+@pytest.mark.parametrize('pattern', SAFE_SHAPES)
+def test_linear_shapes_stay_on_re(pattern):
+    assert classify_pattern(pattern)[0] == 'safe'
+    assert isinstance(compile_regex(pattern), re.Pattern)
+
+
+def test_literals():
+    assert classify_pattern('invoice')[0] == 'literal'
+
+
+@pytest.mark.parametrize('pattern', [r'.*a.*b', r'(ab|a)+c', r'(\w+)\s\1'])
+def test_guarded_matches_equal_plain_re(pattern):
+    regex = GuardedRegex(pattern, re.IGNORECASE)
+    rng = random.Random(pattern)
+    try:
+        for _ in range(20):
+            text = ''.join(rng.choice('abcAB \n') for _ in range(rng.randint(0, 40)))
+            expected = [m.span() for m in re.finditer(pattern, text, re.IGNORECASE)]
+            assert [m.span() for m in regex.finditer(text)] == expected
+    finally:
+        regex.close()
+
+
+@pytest.mark.parametrize('pattern', [r'foo\d+bar', r'(?i)Total: \d+', r'ab(c|d)ef', r'x*yz'])
+def test_required_literal_is_in_every_match(pattern):
+    literal, ignore_case = required_literal(pattern)
+    assert literal
+    rng = random.Random(pattern)
+    for _ in range(300):
+        text = ''.join(rng.choice(['foo', 'bar', '1', 'Total: ', 'ab', 'c', 'd', 'ef', 'x', 'yz', ' '])
+                       for _ in range(12))
+        for match in re.finditer(pattern, text):
+            found = match.group().lower() if ignore_case else match.group()
+            assert (literal.lower() if ignore_case else literal) in found
@@ -0,0 +1,49 @@
+import random
+import re
+
+import pytest
+
+from trigram_index import TrigramIndex, encode_postings, decode_postings
+
+
+def test_postings_round_trip():
+    rng = random.Random(29)
+    for _ in range(200):
+        doc_ids = sorted(rng.sample(range(1 << rng.randint(6, 30)), rng.randint(0, 50)))
+        assert decode_postings(encode_postings(doc_ids)) == doc_ids
+    edges = [0, 127, 128, 16383, 16384, 2 ** 40]
+    assert decode_postings(encode_postings(edges)) == edges
+
+
+PATTERNS = [r'foo', r'fo+bar', r'(cat|dog)food', r'ab.*cd', r'[xy]zz\d', r'hello\s+world', r'a', r'q(uu)?ick',
+            r'(?i)FOOBAR', r'baz$']
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = random.Random(7)
+    pieces = ['foo', 'bar', 'cat', 'dog', 'food', 'ab', 'cd', 'xzz1', 'yzz', 'hello', 'world', ' ', '\n', 'quick',
+              'quuick', 'baz', 'FOOBAR']
+    texts = {}
+    for i in range(60):
+        path = tmp_path / 'docs' / f'{i}.txt'
+        path.parent.mkdir(exist_ok=True)
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        path.write_text(text)
+        texts[str(path)] = text
+    return tmp_path, texts
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_candidates_cover_every_matching_file(corpus, pattern):
+    tmp_path, texts = corpus
+    index = TrigramIndex(str(tmp_path / 'index'))
+    try:
+        index.update(list(texts))
+        regex = re.compile(pattern, re.IGNORECASE)
+        matching = {path for path, text in texts.items() if any(regex.search(line) for line in text.splitlines())}
+        candidates = index.candidates(regex)
+        if candidates is not None:
+            assert matching <= candidates
+    finally:
+        index.close()